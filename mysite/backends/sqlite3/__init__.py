@@ -0,0 +1 @@
+"""A SQLite backend tuned for concurrent readers and writers."""
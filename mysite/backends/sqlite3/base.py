@@ -0,0 +1,30 @@
+"""The SQLite backend of the production database profile.
+
+It behaves like django.db.backends.sqlite3 with two additions read from the
+database settings: PRAGMAS, applied to every new connection, and
+TRANSACTION_MODE, used to open transactions.  BEGIN IMMEDIATE takes the write
+lock up front, so a transaction that reads before it writes waits for the
+busy timeout instead of failing with "database is locked" on lock upgrade.
+"""
+from django.db.backends.sqlite3 import base
+
+
+def apply_pragmas(connection, pragmas):
+    """Run PRAGMA name = value on a DB-API connection for each pragma."""
+    for name, value in pragmas.items():
+        connection.execute(f'PRAGMA {name} = {value}')
+
+
+class DatabaseWrapper(base.DatabaseWrapper):
+    """A SQLite connection with pragmas and a configurable BEGIN mode."""
+
+    def get_new_connection(self, conn_params):
+        """Open a connection and apply the configured pragmas."""
+        connection = super().get_new_connection(conn_params)
+        apply_pragmas(connection, self.settings_dict.get('PRAGMAS', {}))
+        return connection
+
+    def _start_transaction_under_autocommit(self):
+        """Start a transaction with the configured locking mode."""
+        mode = self.settings_dict.get('TRANSACTION_MODE', 'DEFERRED')
+        self.cursor().execute(f'BEGIN {mode}')
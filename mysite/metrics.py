@@ -0,0 +1,166 @@
+"""Per-request SQL, template and total timing for the site.
+
+Enabled with REQUEST_METRICS.  When it is off, neither the middleware nor the
+timed template backend is installed, so requests pay nothing for it, and the
+metrics page is not found.
+"""
+import contextvars
+import math
+import threading
+import time
+from collections import deque
+from contextlib import ExitStack
+
+from django.db import connections
+from django.template.backends.django import DjangoTemplates
+
+# Upper bounds of the histogram buckets in milliseconds.
+BUCKETS_MS = (1, 5, 10, 25, 50, 100, 250, 500, 1000, 2500, float('inf'))
+
+_current = contextvars.ContextVar('request_metrics', default=None)
+
+
+class RollingHistogram:
+    """Keep the most recent samples of one measurement."""
+
+    def __init__(self, size):
+        """Create an empty histogram holding at most size samples."""
+        self.samples = deque(maxlen=size)
+
+    def add(self, value):
+        """Record one sample."""
+        self.samples.append(value)
+
+    def snapshot(self):
+        """Return the count, mean, percentiles and bucket counts."""
+        ordered = sorted(self.samples)
+        if not ordered:
+            return {'count': 0}
+
+        def rank(pct):
+            return ordered[max(math.ceil(pct / 100 * len(ordered)), 1) - 1]
+
+        buckets, start = {}, 0
+        for bound in BUCKETS_MS:
+            end = start
+            while end < len(ordered) and ordered[end] <= bound:
+                end += 1
+            buckets['le_' + str(bound)] = end
+            start = end
+        return {
+            'count': len(ordered),
+            'mean': sum(ordered) / len(ordered),
+            'p50': rank(50), 'p95': rank(95), 'p99': rank(99),
+            'buckets': buckets,
+        }
+
+
+class MetricsRegistry:
+    """Rolling histograms of every measurement, per URL name."""
+
+    MEASUREMENTS = ('sql_count', 'sql_ms', 'template_ms', 'total_ms')
+
+    def __init__(self, size=1000):
+        """Create an empty registry keeping size samples per histogram."""
+        self.size = size
+        self._histograms = {}
+        self._lock = threading.Lock()
+
+    def record(self, url_name, values):
+        """Add the measurements of one request."""
+        with self._lock:
+            histograms = self._histograms.setdefault(url_name, {
+                name: RollingHistogram(self.size)
+                for name in self.MEASUREMENTS})
+            for name in self.MEASUREMENTS:
+                histograms[name].add(values[name])
+
+    def snapshot(self):
+        """Return the summaries of every URL name."""
+        with self._lock:
+            return {
+                url_name: {name: histogram.snapshot()
+                           for name, histogram in histograms.items()}
+                for url_name, histograms in self._histograms.items()
+            }
+
+
+registry = MetricsRegistry()
+
+
+def _count_query(execute, sql, params, many, context):
+    """Time one SQL statement of the current request."""
+    started = time.perf_counter()
+    try:
+        return execute(sql, params, many, context)
+    finally:
+        values = _current.get()
+        if values is not None:
+            values['sql_count'] += 1
+            values['sql_ms'] += (time.perf_counter() - started) * 1000
+
+
+class RequestMetricsMiddleware:
+    """Measure each request and report it in a Server-Timing header."""
+
+    def __init__(self, get_response):
+        """Keep the next handler in the chain."""
+        self.get_response = get_response
+
+    def __call__(self, request):
+        """Run the request with SQL timing and record its measurements."""
+        values = {'sql_count': 0, 'sql_ms': 0.0, 'template_ms': 0.0}
+        token = _current.set(values)
+        started = time.perf_counter()
+        try:
+            with ExitStack() as stack:
+                for connection in connections.all():
+                    stack.enter_context(
+                        connection.execute_wrapper(_count_query))
+                response = self.get_response(request)
+        finally:
+            _current.reset(token)
+        values['total_ms'] = (time.perf_counter() - started) * 1000
+        match = request.resolver_match
+        registry.record(match.view_name if match else '<unresolved>', values)
+        response['Server-Timing'] = (
+            f'sql;dur={values["sql_ms"]:.2f};'
+            f'desc="{values["sql_count"]} queries", '
+            f'tpl;dur={values["template_ms"]:.2f}, '
+            f'total;dur={values["total_ms"]:.2f}')
+        return response
+
+
+class _TimedTemplate:
+    """A template whose render time is added to the current request."""
+
+    def __init__(self, template):
+        """Wrap a template of the Django backend."""
+        self.template = template
+
+    def __getattr__(self, name):
+        """Expose the wrapped template's other attributes."""
+        return getattr(self.template, name)
+
+    def render(self, context=None, request=None):
+        """Render the wrapped template and time it."""
+        started = time.perf_counter()
+        try:
+            return self.template.render(context, request)
+        finally:
+            values = _current.get()
+            if values is not None:
+                values['template_ms'] += (
+                    time.perf_counter() - started) * 1000
+
+
+class TimedDjangoTemplates(DjangoTemplates):
+    """The Django template backend, timing every top-level render."""
+
+    def from_string(self, template_code):
+        """Return a timed template compiled from a string."""
+        return _TimedTemplate(super().from_string(template_code))
+
+    def get_template(self, template_name):
+        """Return a timed template loaded by name."""
+        return _TimedTemplate(super().get_template(template_name))
@@ -0,0 +1,46 @@
+"""This module contains the password hashing policy of the project.
+
+PASSWORD_HASHER and PASSWORD_ITERATIONS choose the hasher and cost used for
+new passwords; the iterations never drop below Django's default.  Hashes
+made under an earlier policy still verify and are upgraded at the next
+login.  Hashing runs in a pool of PASSWORD_HASH_WORKERS threads, so a burst
+of signups queues for those threads instead of taking every CPU away from
+the requests served next to it, and an async view can await the hash
+without holding up its event loop.
+"""
+import asyncio
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+from django.contrib.auth.hashers import PBKDF2PasswordHasher, make_password
+
+
+class TunedPBKDF2PasswordHasher(PBKDF2PasswordHasher):
+    """A PBKDF2 hasher whose iterations PASSWORD_ITERATIONS can raise."""
+
+    @property
+    def iterations(self):
+        """Return the configured iterations, never fewer than Django's."""
+        return max(settings.PASSWORD_ITERATIONS, super().iterations)
+
+
+_pool = None
+_pool_lock = threading.Lock()
+
+
+def hashing_pool():
+    """Return the process-wide thread pool that hashes passwords."""
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            _pool = ThreadPoolExecutor(
+                max_workers=settings.PASSWORD_HASH_WORKERS,
+                thread_name_prefix='password-hash')
+        return _pool
+
+
+async def hash_password(raw_password):
+    """Hash a password in the hashing pool and return the encoded hash."""
+    return await asyncio.wrap_future(
+        hashing_pool().submit(make_password, raw_password))
@@ -0,0 +1,68 @@
+"""Primary/replica database routing with read-your-writes stickiness.
+
+Reads go to one of DATABASE_REPLICAS and writes to the default (primary)
+database.  PinPrimaryMiddleware sends every query of a request to the
+primary when the request writes (any unsafe method), when it is an admin
+page, or when the same client wrote within the last PIN_PRIMARY_SECONDS, so
+a voter's next page never reads from a replica that is still catching up.
+Reads inside a transaction on the primary stay there as well, so code that
+reads before it writes, like the vote buffer and the vote commands, never
+works from a lagging copy.
+"""
+import contextvars
+import random
+
+from django.conf import settings
+from django.db import connections
+from django.urls import reverse
+
+PIN_COOKIE = 'pin_primary'
+
+_pinned = contextvars.ContextVar('pinned_to_primary', default=False)
+
+
+class PrimaryReplicaRouter:
+    """Route reads to the replicas and writes to the primary."""
+
+    def db_for_read(self, model, **hints):
+        """Return a replica, or the primary when pinned or in a transaction."""
+        if (_pinned.get() or not settings.DATABASE_REPLICAS
+                or connections['default'].in_atomic_block):
+            return 'default'
+        return random.choice(settings.DATABASE_REPLICAS)
+
+    def db_for_write(self, model, **hints):
+        """Send every write to the primary."""
+        return 'default'
+
+    def allow_relation(self, obj1, obj2, **hints):
+        """Allow relations, since every database holds the same rows."""
+        return True
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        """Only migrate the primary; replicas follow it."""
+        return db == 'default'
+
+
+class PinPrimaryMiddleware:
+    """Pin writing, admin and just-wrote requests to the primary database."""
+
+    def __init__(self, get_response):
+        """Keep the next handler in the chain."""
+        self.get_response = get_response
+
+    def __call__(self, request):
+        """Run the request pinned or not, and remember writes in a cookie."""
+        writes = request.method not in ('GET', 'HEAD', 'OPTIONS', 'TRACE')
+        pinned = (writes or PIN_COOKIE in request.COOKIES
+                  or request.path_info.startswith(reverse('admin:index')))
+        token = _pinned.set(pinned)
+        try:
+            response = self.get_response(request)
+        finally:
+            _pinned.reset(token)
+        if writes:
+            response.set_cookie(PIN_COOKIE, '1', httponly=True,
+                                max_age=settings.PIN_PRIMARY_SECONDS,
+                                samesite='Lax')
+        return response
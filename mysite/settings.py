@@ -27,7 +27,7 @@ SECRET_KEY = config('SECRET KEY', default='missing-secret-key')
 # SECURITY WARNING: don't run with debug turned on in production!
 DEBUG = config('DEBUG', cast=bool, default=False)
 
-ALLOWED_HOSTS = []
+ALLOWED_HOSTS = config('ALLOWED_HOSTS', cast=Csv(), default='')
 
 
 # Application definition
@@ -69,13 +69,45 @@ TEMPLATES = [
         },
     },
 ]
+
+# Record SQL, template and total time per request in Server-Timing headers
+# and in rolling histograms shown to staff at /metrics/.
+REQUEST_METRICS = config('REQUEST_METRICS', cast=bool, default=False)
+if REQUEST_METRICS:
+    MIDDLEWARE.insert(0, 'mysite.metrics.RequestMetricsMiddleware')
+    TEMPLATES[0]['BACKEND'] = 'mysite.metrics.TimedDjangoTemplates'
+
 WSGI_APPLICATION = 'mysite.wsgi.application'
 
+# Route the detail, results and vote URLs to the native async views; enable
+# when serving mysite.asgi:application with an ASGI server such as uvicorn.
+ASYNC_VIEWS = config('ASYNC_VIEWS', cast=bool, default=False)
+
 AUTHENTICATION_BACKENDS = [
     # username/password authentication
    'django.contrib.auth.backends.ModelBackend',  
 ]
 
+# Keep the users of sessions in USER_CACHE_ALIAS for USER_CACHE_TTL seconds
+# instead of reading auth_user on every request; 0 turns the cache off.
+# Use a cache shared by every worker, so a password change reaches them all.
+# Switching backends signs existing sessions out once.
+USER_CACHE_TTL = config('USER_CACHE_TTL', cast=int, default=0)
+USER_CACHE_ALIAS = config('USER_CACHE_ALIAS', default='default')
+if USER_CACHE_TTL:
+    AUTHENTICATION_BACKENDS = ['polls.backends.CachedModelBackend']
+
+# SESSION_PROFILE picks where sessions live: db (one query per request),
+# cached_db (read from SESSION_CACHE_ALIAS, written through to the database)
+# or signed_cookies (kept by the client, no server storage).
+SESSION_PROFILE = config('SESSION_PROFILE', default='db')
+SESSION_ENGINE = {
+    'db': 'django.contrib.sessions.backends.db',
+    'cached_db': 'django.contrib.sessions.backends.cached_db',
+    'signed_cookies': 'django.contrib.sessions.backends.signed_cookies',
+}[SESSION_PROFILE]
+SESSION_CACHE_ALIAS = config('SESSION_CACHE_ALIAS', default='default')
+
 # Database
 # https://docs.djangoproject.com/en/4.1/ref/settings/#databases
 
@@ -86,6 +118,165 @@ DATABASES = {
     }
 }
 
+# DB_PROFILE=production keeps connections open between requests and tunes
+# SQLite so readers never wait for a vote being written: write-ahead logging,
+# fewer fsyncs, a memory-mapped file, a larger page cache, a busy timeout and
+# transactions that take the write lock as soon as they begin.
+DB_PROFILE = config('DB_PROFILE', default='default')
+if DB_PROFILE == 'production':
+    DATABASES['default'].update({
+        'ENGINE': 'mysite.backends.sqlite3',
+        'CONN_MAX_AGE': config('DB_CONN_MAX_AGE', cast=int, default=600),
+        'CONN_HEALTH_CHECKS': True,
+        'OPTIONS': {
+            'timeout': config('DB_BUSY_TIMEOUT', cast=float, default=20.0),
+        },
+        'PRAGMAS': {
+            'journal_mode': 'WAL',
+            'synchronous': 'NORMAL',
+            'mmap_size': config('DB_MMAP_SIZE', cast=int, default=268435456),
+            'cache_size': config('DB_CACHE_SIZE', cast=int, default=-65536),
+        },
+        'TRANSACTION_MODE': 'IMMEDIATE',
+    })
+
+# DB_ENGINE=postgresql uses a PostgreSQL server instead of the SQLite file
+# (needs the psycopg package).
+DB_ENGINE = config('DB_ENGINE', default='sqlite')
+if DB_ENGINE == 'postgresql':
+    DATABASES['default'] = {
+        'ENGINE': 'django.db.backends.postgresql',
+        'NAME': config('DB_NAME', default='ku_polls'),
+        'USER': config('DB_USER', default=''),
+        'PASSWORD': config('DB_PASSWORD', default=''),
+        'HOST': config('DB_HOST', default=''),
+        'PORT': config('DB_PORT', default=''),
+        'CONN_MAX_AGE': config('DB_CONN_MAX_AGE', cast=int, default=600),
+        'CONN_HEALTH_CHECKS': True,
+    }
+
+# Read replicas of the default database: PostgreSQL hosts, or SQLite files
+# kept in sync outside Django.  Reads are spread over them while writes, the
+# admin and each client's requests for PIN_PRIMARY_SECONDS after a write stay
+# on the primary.
+DB_REPLICAS = config('DB_REPLICAS', cast=Csv(), default='')
+DATABASE_REPLICAS = []
+for number, replica in enumerate(DB_REPLICAS):
+    alias = f'replica{number}'
+    location = 'HOST' if DB_ENGINE == 'postgresql' else 'NAME'
+    DATABASES[alias] = {**DATABASES['default'], location: replica,
+                        'TEST': {'MIRROR': 'default'}}
+    DATABASE_REPLICAS.append(alias)
+PIN_PRIMARY_SECONDS = config('PIN_PRIMARY_SECONDS', cast=int, default=10)
+if DATABASE_REPLICAS:
+    DATABASE_ROUTERS = ['mysite.routers.PrimaryReplicaRouter']
+    MIDDLEWARE.insert(0, 'mysite.routers.PinPrimaryMiddleware')
+
+# Token bucket limits of the write views as "count/period" with a period of
+# s, m, h or d; an empty rate turns the throttle of that view off.  Each
+# logged in user has a bucket, and each IP address a larger one shared by
+# everyone behind it.  Buckets live in this process unless
+# THROTTLE_CACHE_ALIAS names a shared cache.  THROTTLE_PROXY_COUNT is the
+# number of reverse proxies that add the client address to X-Forwarded-For.
+THROTTLE_RATES = {
+    'vote': config('VOTE_THROTTLE_RATE', default='30/m'),
+    'signup': config('SIGNUP_THROTTLE_RATE', default='10/h'),
+}
+THROTTLE_IP_RATES = {
+    'vote': config('VOTE_IP_THROTTLE_RATE', default='600/m'),
+    'signup': config('SIGNUP_IP_THROTTLE_RATE', default='200/h'),
+}
+THROTTLE_PROXY_COUNT = config('THROTTLE_PROXY_COUNT', cast=int, default=0)
+THROTTLE_CACHE_ALIAS = config('THROTTLE_CACHE_ALIAS', default='')
+THROTTLE_MAX_ENTRIES = config('THROTTLE_MAX_ENTRIES', cast=int, default=10000)
+
+# Admin changelists of tables with at least this many rows show the planner's
+# row estimate instead of running COUNT(*).
+ADMIN_COUNT_ESTIMATE_THRESHOLD = config(
+    'ADMIN_COUNT_ESTIMATE_THRESHOLD', cast=int, default=100000)
+
+
+# Cache
+# https://docs.djangoproject.com/en/4.1/topics/cache/
+
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+    },
+    # Built results tallies; LocMemCache evicts least recently used entries
+    # once MAX_ENTRIES is reached.
+    'polls_results': {
+        'BACKEND': config(
+            'RESULTS_CACHE_BACKEND',
+            default='django.core.cache.backends.locmem.LocMemCache'),
+        'LOCATION': config('RESULTS_CACHE_LOCATION', default='polls-results'),
+        'TIMEOUT': config('RESULTS_CACHE_TTL', cast=int, default=300),
+        'OPTIONS': {
+            'MAX_ENTRIES': config(
+                'RESULTS_CACHE_MAX_ENTRIES', cast=int, default=1000),
+        },
+    },
+    # Whole pages served to anonymous visitors by polls.pagecache.
+    'polls_pages': {
+        'BACKEND': config(
+            'PAGE_CACHE_BACKEND',
+            default='django.core.cache.backends.locmem.LocMemCache'),
+        'LOCATION': config('PAGE_CACHE_LOCATION', default='polls-pages'),
+        'OPTIONS': {
+            'MAX_ENTRIES': config(
+                'PAGE_CACHE_MAX_ENTRIES', cast=int, default=1000),
+        },
+    },
+    # Rendered {% cache %} fragments of the poll templates, keyed by the
+    # question's edit_version so edits never serve a stale fragment.
+    'template_fragments': {
+        'BACKEND': config(
+            'FRAGMENT_CACHE_BACKEND',
+            default='django.core.cache.backends.locmem.LocMemCache'),
+        'LOCATION': config(
+            'FRAGMENT_CACHE_LOCATION', default='polls-fragments'),
+        'OPTIONS': {
+            'MAX_ENTRIES': config(
+                'FRAGMENT_CACHE_MAX_ENTRIES', cast=int, default=5000),
+        },
+    },
+}
+
+RESULTS_CACHE_ALIAS = 'polls_results'
+
+# Cache whole index and results pages for visitors without a session or
+# pending messages.  Votes and edits expire the pages they change; the TTL
+# bounds how late a question appears or closes on a cached page.
+PAGE_CACHE_ENABLED = config('PAGE_CACHE_ENABLED', cast=bool, default=False)
+PAGE_CACHE_TTL = config('PAGE_CACHE_TTL', cast=int, default=60)
+PAGE_CACHE_ALIAS = 'polls_pages'
+
+# How long a tally built for an older vote_version may still be served while
+# another request rebuilds it.
+RESULTS_CACHE_STALE_SECONDS = config(
+    'RESULTS_CACHE_STALE_SECONDS', cast=int, default=5)
+
+
+# Live results streams: the pub/sub broker class, the shortest time between
+# two pushes to one stream and the keep-alive period, in seconds.
+RESULTS_EVENT_BROKER = config(
+    'RESULTS_EVENT_BROKER', default='polls.events.LocalBroker')
+RESULTS_STREAM_INTERVAL = config(
+    'RESULTS_STREAM_INTERVAL', cast=float, default=1.0)
+RESULTS_STREAM_HEARTBEAT = config(
+    'RESULTS_STREAM_HEARTBEAT', cast=float, default=15.0)
+# The stream holds its connection open, so it is only offered under ASGI.
+RESULTS_STREAM_ENABLED = config(
+    'RESULTS_STREAM_ENABLED', cast=bool, default=ASYNC_VIEWS)
+
+
+# Buffered vote ingestion: votes are queued in memory and written in batches
+# by a background thread instead of one transaction per request.
+VOTE_BUFFER_ENABLED = config('VOTE_BUFFER_ENABLED', cast=bool, default=False)
+VOTE_BUFFER_BATCH_SIZE = config('VOTE_BUFFER_BATCH_SIZE', cast=int, default=500)
+VOTE_BUFFER_FLUSH_INTERVAL = config(
+    'VOTE_BUFFER_FLUSH_INTERVAL', cast=float, default=1.0)
+
 
 # Password validation
 # https://docs.djangoproject.com/en/4.1/ref/settings/#auth-password-validators
@@ -105,6 +296,23 @@ AUTH_PASSWORD_VALIDATORS = [
     },
 ]
 
+# Hasher and cost of new passwords (pbkdf2, argon2, bcrypt or scrypt; argon2
+# and bcrypt need their extra packages).  PASSWORD_ITERATIONS raises the
+# PBKDF2 iterations; a value below Django's default, such as 0, keeps the
+# default, so the setting can never weaken new hashes.  Every hasher stays
+# listed so existing passwords keep working.
+PASSWORD_HASHER = config('PASSWORD_HASHER', default='pbkdf2')
+PASSWORD_ITERATIONS = config('PASSWORD_ITERATIONS', cast=int, default=0)
+PASSWORD_HASH_WORKERS = config('PASSWORD_HASH_WORKERS', cast=int, default=2)
+_hashers = {
+    'pbkdf2': 'mysite.passwords.TunedPBKDF2PasswordHasher',
+    'pbkdf2_sha1': 'django.contrib.auth.hashers.PBKDF2SHA1PasswordHasher',
+    'argon2': 'django.contrib.auth.hashers.Argon2PasswordHasher',
+    'bcrypt': 'django.contrib.auth.hashers.BCryptSHA256PasswordHasher',
+    'scrypt': 'django.contrib.auth.hashers.ScryptPasswordHasher',
+}
+PASSWORD_HASHERS = [_hashers.pop(PASSWORD_HASHER), *_hashers.values()]
+
 
 # Internationalization
 # https://docs.djangoproject.com/en/4.1/topics/i18n/
@@ -117,7 +325,7 @@ USE_I18N = True
 
 USE_TZ = True
 
-LOGIN_REDIRECT_URL = 'polls'    # show list of polls
+LOGIN_REDIRECT_URL = 'polls:index'    # show list of polls
 LOGOUT_REDIRECT_URL =  'login'
 
 
@@ -125,6 +333,21 @@ LOGOUT_REDIRECT_URL =  'login'
 # https://docs.djangoproject.com/en/4.1/howto/static-files/
 
 STATIC_URL = 'static/'
+STATIC_ROOT = config('STATIC_ROOT', default=str(BASE_DIR / 'staticfiles'))
+
+# STATIC_PROFILE=production stores collected files under content-hashed
+# names with pre-compressed copies and serves STATIC_URL from the app with
+# immutable cache headers; run collectstatic before starting the server.
+STATIC_PROFILE = config('STATIC_PROFILE', default='default')
+if STATIC_PROFILE == 'production':
+    STORAGES = {
+        'default': {
+            'BACKEND': 'django.core.files.storage.FileSystemStorage',
+        },
+        'staticfiles': {
+            'BACKEND': 'mysite.staticfiles.CompressedManifestStaticFilesStorage',
+        },
+    }
 
 # Default primary key field type
 # https://docs.djangoproject.com/en/4.1/ref/settings/#default-auto-field
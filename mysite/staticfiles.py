@@ -0,0 +1,86 @@
+"""This module contains the production static file pipeline.
+
+With STATIC_PROFILE=production, collectstatic writes every file under a
+content-hashed name listed in a manifest, plus .gz (and .br when the brotli
+package is installed) siblings of the text assets.  serve_static() then
+answers /static/ from the app process with the smallest encoding the client
+accepts, and marks hashed names as immutable so browsers never revalidate.
+"""
+import gzip
+import mimetypes
+import os
+import re
+
+from django.conf import settings
+from django.contrib.staticfiles.storage import ManifestStaticFilesStorage
+from django.core.exceptions import SuspiciousFileOperation
+from django.http import FileResponse, Http404
+from django.utils._os import safe_join
+from django.views.decorators.http import require_safe
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+COMPRESSIBLE = ('.css', '.js', '.json', '.map', '.svg', '.txt', '.xml',
+                '.html')
+HASHED_NAME = re.compile(r'\.[0-9a-f]{12}\.[^./]+$')
+IMMUTABLE = 'public, max-age=31536000, immutable'
+# Names that keep their path across deploys may change at any time.
+UNHASHED = 'public, max-age=60'
+
+
+def compress(path):
+    """Write the .gz and .br siblings of a file where they are smaller."""
+    with open(path, 'rb') as source:
+        data = source.read()
+    encoded = {'.gz': gzip.compress(data, compresslevel=9, mtime=0)}
+    if brotli is not None:
+        encoded['.br'] = brotli.compress(data)
+    for suffix, compressed in encoded.items():
+        if len(compressed) < len(data):
+            with open(path + suffix, 'wb') as target:
+                target.write(compressed)
+
+
+class CompressedManifestStaticFilesStorage(ManifestStaticFilesStorage):
+    """A manifest storage that also pre-compresses the hashed text files."""
+
+    def post_process(self, paths, dry_run=False, **options):
+        """Hash the collected files, then compress the hashed copies."""
+        yield from super().post_process(paths, dry_run=dry_run, **options)
+        if dry_run:
+            return
+        for hashed_name in set(self.hashed_files.values()):
+            if hashed_name.endswith(COMPRESSIBLE):
+                compress(self.path(hashed_name))
+
+
+@require_safe
+def serve_static(request, path):
+    """Serve a collected static file with long-lived cache headers."""
+    try:
+        full_path = safe_join(settings.STATIC_ROOT, path)
+    except SuspiciousFileOperation:
+        raise Http404('Invalid static path.')
+    if not os.path.isfile(full_path):
+        raise Http404('No such static file.')
+    content_type = mimetypes.guess_type(full_path)[0]
+    accepted = {token.split(';')[0].strip() for token in
+                request.headers.get('Accept-Encoding', '').split(',')}
+    encoding = None
+    for name, suffix in (('br', '.br'), ('gzip', '.gz')):
+        if name in accepted and os.path.isfile(full_path + suffix):
+            full_path, encoding = full_path + suffix, name
+            break
+    response = FileResponse(
+        open(full_path, 'rb'),
+        content_type=content_type or 'application/octet-stream')
+    del response['Content-Disposition']
+    if encoding:
+        response['Content-Encoding'] = encoding
+    response['Vary'] = 'Accept-Encoding'
+    response['Cache-Control'] = (
+        IMMUTABLE if HASHED_NAME.search(path) else UNHASHED)
+    return response
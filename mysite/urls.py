@@ -1,12 +1,19 @@
+from django.conf import settings
 from django.contrib import admin
-from django.urls import path, include
+from django.urls import path, include, re_path
 from django.views.generic import RedirectView
 from . import views
+from .staticfiles import serve_static
 
 urlpatterns = [
     path("", RedirectView.as_view(url='polls/')),
     path('polls/', include('polls.urls')),
     path('admin/', admin.site.urls),
     path('accounts/', include('django.contrib.auth.urls')),
-    path('signup/', views.signup, name='signup')
+    path('signup/', views.signup, name='signup'),
+    path('metrics/', views.metrics, name='metrics'),
 ]
+
+if settings.STATIC_PROFILE == 'production':
+    urlpatterns.append(re_path(
+        rf'^{settings.STATIC_URL.strip("/")}/(?P<path>.+)$', serve_static))
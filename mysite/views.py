@@ -1,5 +1,14 @@
+from asgiref.sync import sync_to_async
+from django.conf import settings
 from django.shortcuts import render, redirect
-from django.contrib.auth import login, authenticate
+from django.contrib.admin.views.decorators import staff_member_required
+from django.http import Http404, JsonResponse
+
+from polls.throttle import throttle
+
+from .metrics import registry
+from .passwords import hash_password
+from django.contrib.auth import login
 from django.contrib.auth.forms import UserCreationForm
 from django.views.generic import ListView
 from django.contrib.auth.mixins import LoginRequiredMixin
@@ -9,19 +18,40 @@ class EyesOnlyView(LoginRequiredMixin, ListView):
     login_url = '/accounts/login/'
     
 
-def signup(request):
-    """Register a new user."""
+@throttle('signup')
+async def signup(request):
+    """Register a new user and log them in.
+
+    The password is hashed once, awaiting the hashing pool, and the new user
+    is logged in directly instead of being authenticated with it again.
+    """
     if request.method == 'POST':
         form = UserCreationForm(request.POST)
-        if form.is_valid():
-            form.save()
-            username = form.cleaned_data.get('username')
-            raw_passwd = form.cleaned_data.get('password')
-            user = authenticate(username=username,password=raw_passwd)
-            login(request, user)
-        return redirect('polls')
-        # what if form is not valid?
-        # we should display a message in signup.html
+        if await sync_to_async(form.is_valid)():
+            user = form.instance
+            user.password = await hash_password(
+                form.cleaned_data['password1'])
+            await sync_to_async(user.save)()
+            await sync_to_async(login)(
+                request, user, backend=settings.AUTHENTICATION_BACKENDS[0])
+            return redirect(settings.LOGIN_REDIRECT_URL)
     else:
         form = UserCreationForm()
-    return render(request, 'registration/signup.html', {'form':form})
\ No newline at end of file
+    return render(request, 'registration/signup.html', {'form':form})
+
+
+def metrics(request):
+    """Show the rolling request metrics per URL name to staff users.
+
+    While REQUEST_METRICS is off nothing is collected, so the page is not
+    found for anyone rather than showing staff an empty snapshot.
+    """
+    if not settings.REQUEST_METRICS:
+        raise Http404('Request metrics are disabled.')
+    return _staff_metrics(request)
+
+
+@staff_member_required
+def _staff_metrics(request):
+    """Return the metrics snapshot as JSON."""
+    return JsonResponse({'views': registry.snapshot()})
@@ -1,7 +1,59 @@
 """This module is the admin page of the application."""
+from django import forms
+from django.conf import settings
 from django.contrib import admin
+from django.core.exceptions import ValidationError
+from django.core.paginator import Paginator
+from django.db import DatabaseError, connections
+from django.utils.functional import cached_property
 
-from .models import Question, Choice
+from .clock import request_now
+from .models import Question, QuestionQuerySet, Choice, Votes
+
+
+def estimated_count(queryset):
+    """Return the planner's row estimate for a model's table, or None.
+
+    PostgreSQL keeps it in pg_class.reltuples and SQLite in sqlite_stat1,
+    both refreshed by ANALYZE, so reading it does not scan the table.
+    """
+    connection = connections[queryset.db]
+    table = queryset.model._meta.db_table
+    if connection.vendor == 'postgresql':
+        sql = 'SELECT reltuples FROM pg_class WHERE oid = %s::regclass'
+    elif connection.vendor == 'sqlite':
+        sql = 'SELECT stat FROM sqlite_stat1 WHERE tbl = %s LIMIT 1'
+    else:
+        return None
+    try:
+        with connection.cursor() as cursor:
+            cursor.execute(sql, [table])
+            row = cursor.fetchone()
+    except DatabaseError:
+        return None
+    if row is None:
+        return None
+    estimate = int(str(row[0]).split()[0])
+    return estimate if estimate >= 0 else None
+
+
+class EstimatedCountPaginator(Paginator):
+    """A paginator that estimates the size of large unfiltered tables.
+
+    An exact COUNT(*) is still used for filtered or searched lists and for
+    tables smaller than ADMIN_COUNT_ESTIMATE_THRESHOLD rows.
+    """
+
+    @cached_property
+    def count(self):
+        """Return the estimated or exact number of objects."""
+        queryset = self.object_list
+        if not queryset.query.where:
+            estimate = estimated_count(queryset)
+            if (estimate is not None and
+                    estimate >= settings.ADMIN_COUNT_ESTIMATE_THRESHOLD):
+                return estimate
+        return super().count
 
 
 class ChoiceInline(admin.StackedInline):
@@ -11,6 +63,24 @@ class ChoiceInline(admin.StackedInline):
     extra = 3
 
 
+class StatusListFilter(admin.SimpleListFilter):
+    """Filter questions by their status, in the database."""
+
+    title = 'status'
+    parameter_name = 'status'
+
+    def lookups(self, request, model_admin):
+        """Return the statuses a question can be in."""
+        return [(status, status.capitalize())
+                for status in QuestionQuerySet.STATUSES]
+
+    def queryset(self, request, queryset):
+        """Return the questions in the selected status."""
+        if self.value() in QuestionQuerySet.STATUSES:
+            return getattr(queryset, self.value())(request_now(request))
+        return queryset
+
+
 class QuestionAdmin(admin.ModelAdmin):
     """Contains a questions information."""
 
@@ -20,11 +90,81 @@ class QuestionAdmin(admin.ModelAdmin):
          'pub_date', 'end_date'], 'classes': ['collapse']}),
     ]
     inlines = [ChoiceInline]
-    list_display = ('question_text', 'pub_date',
+    list_display = ('question_text', 'pub_date', 'get_status', 'total_votes',
                     'was_published_recently', 'can_vote', 'is_published')
-    list_filter = ['pub_date', 'end_date']
+    list_filter = [StatusListFilter, 'pub_date', 'end_date']
     search_fields = ['question_text']
+    paginator = EstimatedCountPaginator
+    show_full_result_count = False
+
+    def get_queryset(self, request):
+        """Annotate each question with its status and vote total."""
+        return super().get_queryset(request).with_status(
+            request_now(request)).with_vote_totals()
+
+    @admin.display(ordering='total_votes', description='Votes')
+    def total_votes(self, question):
+        """Return the annotated number of votes for a question."""
+        return question.total_votes
+
+
+class ChoiceAdmin(admin.ModelAdmin):
+    """Contains a choices information."""
+
+    list_display = ('choice_text', 'question', 'vote_count')
+    list_select_related = ('question',)
+    autocomplete_fields = ['question']
+    search_fields = ['choice_text']
+    paginator = EstimatedCountPaginator
+    show_full_result_count = False
+
+
+class VotesAdminForm(forms.ModelForm):
+    """A vote form that takes the question from the chosen choice."""
+
+    class Meta:
+        model = Votes
+        fields = ('user', 'choice')
+
+    def clean(self):
+        """Set the vote's question and reject a second vote on it.
+
+        The question is not a form field, so the model's one vote per
+        question constraint would otherwise only be checked by the database.
+        """
+        cleaned_data = super().clean()
+        user, choice = cleaned_data.get('user'), cleaned_data.get('choice')
+        if choice is not None:
+            self.instance.question_id = choice.question_id
+        if user is not None and choice is not None and Votes.objects.filter(
+                user=user, question_id=choice.question_id).exclude(
+                pk=self.instance.pk).exists():
+            raise ValidationError(
+                'This user has already voted on this question.')
+        return cleaned_data
+
+
+class VotesAdmin(admin.ModelAdmin):
+    """Contains the votes of users, kept in step with the vote counters."""
+
+    form = VotesAdminForm
+    fields = ('user', 'choice')
+    list_display = ('id', 'user', 'question', 'choice')
+    list_select_related = ('user', 'question', 'choice')
+    autocomplete_fields = ['user', 'choice']
+    search_fields = ['user__username']
+    ordering = ['-pk']
+    paginator = EstimatedCountPaginator
+    show_full_result_count = False
+
+    def save_model(self, request, obj, form, change):
+        """Save the vote and recount the choices it moved between."""
+        previous = form.initial.get('choice')
+        super().save_model(request, obj, form, change)
+        Choice.objects.filter(
+            pk__in={previous, obj.choice_id} - {None}).recount()
 
 
 admin.site.register(Question, QuestionAdmin)
-admin.site.register(Choice)
+admin.site.register(Choice, ChoiceAdmin)
+admin.site.register(Votes, VotesAdmin)
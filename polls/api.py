@@ -0,0 +1,110 @@
+"""This module contains the read-only JSON API of the polls application.
+
+Question and results responses carry a strong ETag built from the question's
+vote_version, edit_version and status and a Last-Modified date from its
+pub_date, last vote or closing, so a client that revalidates an unchanged
+resource gets 304 Not Modified after a single indexed row read.
+"""
+from django.http import JsonResponse
+from django.shortcuts import get_object_or_404
+from django.views.decorators.http import condition, require_safe
+
+from .clock import request_now
+from .models import Question, QuestionQuerySet
+from .results import results_for
+from .views import make_cursor, parse_cursor
+
+PAGE_SIZE = 50
+
+
+def _question_json(question):
+    """Return the fields of a question shared by every endpoint."""
+    return {
+        'id': question.pk,
+        'question_text': question.question_text,
+        'pub_date': question.pub_date,
+        'end_date': question.end_date,
+        'status': question.status,
+    }
+
+
+def _validators(request, pk):
+    """Return the fields that decide whether a question resource changed."""
+    if not hasattr(request, '_question_validators'):
+        now = request_now(request)
+        questions = Question.objects.with_status(now).published(now)
+        request._question_validators = questions.filter(pk=pk).values(
+            'vote_version', 'edit_version', 'status', 'pub_date',
+            'end_date', 'last_vote_at').first()
+    return request._question_validators
+
+
+def question_etag(request, pk):
+    """Return the strong ETag of a question and its results."""
+    row = _validators(request, pk)
+    if row is None:
+        return None
+    return (f'{pk}-{row["vote_version"]}-{row["edit_version"]}-'
+            f'{row["status"]}')
+
+
+def question_last_modified(request, pk):
+    """Return when a question was published, last voted on or closed."""
+    row = _validators(request, pk)
+    if row is None:
+        return None
+    changes = [row['pub_date'], row['last_vote_at'] or row['pub_date']]
+    if row['status'] == QuestionQuerySet.CLOSED:
+        changes.append(row['end_date'])
+    return max(changes)
+
+
+def _published_question(request, pk):
+    """Return a published question annotated with its status, or 404."""
+    now = request_now(request)
+    return get_object_or_404(Question.objects.with_status(now).published(
+        now).select_related('snapshot'), pk=pk)
+
+
+@require_safe
+def question_list(request):
+    """List published questions newest first, one keyset page at a time."""
+    now = request_now(request)
+    questions = list(Question.objects.with_status(now).published(now).page(
+        PAGE_SIZE, after=parse_cursor(request.GET.get('after'))))
+    page = questions[:PAGE_SIZE]
+    return JsonResponse({
+        'questions': [_question_json(question) for question in page],
+        'next': make_cursor(page[-1]) if len(questions) > PAGE_SIZE else None,
+    })
+
+
+@require_safe
+@condition(etag_func=question_etag, last_modified_func=question_last_modified)
+def question_detail(request, pk):
+    """Show a published question with its choices."""
+    question = _published_question(request, pk)
+    data = _question_json(question)
+    data['choices'] = [
+        {'id': pk, 'choice_text': text}
+        for pk, text in question.choice_set.order_by('pk').values_list(
+            'pk', 'choice_text')
+    ]
+    return JsonResponse(data)
+
+
+@require_safe
+@condition(etag_func=question_etag, last_modified_func=question_last_modified)
+def question_results(request, pk):
+    """Show the tally of a published question."""
+    question = _published_question(request, pk)
+    results = results_for(question)
+    data = _question_json(question)
+    data['total'] = sum(result.votes for result in results)
+    data['choices'] = [
+        {'id': result.id, 'choice_text': result.choice_text,
+         'votes': result.votes, 'percentage': result.percentage,
+         'is_winner': result.is_winner}
+        for result in results
+    ]
+    return JsonResponse(data)
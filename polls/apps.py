@@ -8,3 +8,7 @@ class PollsConfig(AppConfig):
 
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'polls'
+
+    def ready(self):
+        """Connect the signal receivers of the application."""
+        from . import receivers  # noqa: F401
@@ -0,0 +1,35 @@
+"""This module contains the authentication backend of the application."""
+from django.conf import settings
+from django.contrib.auth.backends import ModelBackend
+from django.core.cache import caches
+
+
+def user_cache_key(user_id):
+    """Return the cache key of a user loaded by CachedModelBackend."""
+    return f'auth-user:{user_id}'
+
+
+def forget_user(user_id):
+    """Drop a user from the cache, so the next request reloads it."""
+    caches[settings.USER_CACHE_ALIAS].delete(user_cache_key(user_id))
+
+
+class CachedModelBackend(ModelBackend):
+    """A ModelBackend that keeps the users of sessions in a cache.
+
+    AuthenticationMiddleware loads request.user on every authenticated
+    request; with this backend that row is read at most once per
+    USER_CACHE_TTL seconds.  The entry is dropped when the user is saved,
+    deleted or logs out, so password changes still end other sessions.
+    """
+
+    def get_user(self, user_id):
+        """Return the cached user, loading and caching it on a miss."""
+        cache = caches[settings.USER_CACHE_ALIAS]
+        key = user_cache_key(user_id)
+        user = cache.get(key)
+        if user is None:
+            user = super().get_user(user_id)
+            if user is not None:
+                cache.set(key, user, settings.USER_CACHE_TTL)
+        return user
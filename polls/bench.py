@@ -0,0 +1,113 @@
+"""This module contains helpers for driving and measuring request load."""
+import http.cookiejar
+import math
+import threading
+import time
+import urllib.parse
+import urllib.request
+from concurrent.futures import ThreadPoolExecutor
+
+
+def percentile(samples, pct):
+    """Return the pct-th percentile of samples by the nearest-rank method."""
+    if not samples:
+        return 0.0
+    ordered = sorted(samples)
+    rank = max(math.ceil(pct / 100 * len(ordered)), 1)
+    return ordered[rank - 1]
+
+
+def summarize(latencies, elapsed, errors=0, queries=None):
+    """Return request count, rate and latency percentiles in milliseconds.
+
+    When the number of SQL queries of each request is known, their mean is
+    included as queries_per_request.
+    """
+    summary = {
+        'requests': len(latencies),
+        'errors': errors,
+        'rps': len(latencies) / elapsed if elapsed else 0.0,
+        'p50_ms': percentile(latencies, 50) * 1000,
+        'p95_ms': percentile(latencies, 95) * 1000,
+        'p99_ms': percentile(latencies, 99) * 1000,
+    }
+    if queries:
+        summary['queries_per_request'] = sum(queries) / len(queries)
+    return summary
+
+
+def drive(fetch, total, concurrency):
+    """Call fetch() total times from concurrency threads and summarize it.
+
+    fetch takes the request number, raises on a failed request and may
+    return the number of SQL queries the request issued.
+    """
+    latencies, queries, lock = [], [], threading.Lock()
+    errors = 0
+
+    def one(number):
+        nonlocal errors
+        started = time.perf_counter()
+        try:
+            count = fetch(number)
+        except Exception:
+            with lock:
+                errors += 1
+            return
+        latency = time.perf_counter() - started
+        with lock:
+            latencies.append(latency)
+            if count is not None:
+                queries.append(count)
+
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        list(pool.map(one, range(total)))
+    return summarize(latencies, time.perf_counter() - started, errors,
+                     queries)
+
+
+def http_fetcher(url, timeout=30):
+    """Return a fetch function that GETs url and reads the whole body."""
+    def fetch(number):
+        with urllib.request.urlopen(url, timeout=timeout) as response:
+            response.read()
+    return fetch
+
+
+def wait_until_up(url, timeout=20):
+    """Block until url answers, or raise TimeoutError."""
+    deadline = time.monotonic() + timeout
+    while True:
+        try:
+            urllib.request.urlopen(url, timeout=1).read()
+            return
+        except Exception:
+            if time.monotonic() > deadline:
+                raise TimeoutError(f'{url} did not come up')
+            time.sleep(0.2)
+
+
+def csrf_token(cookies):
+    """Return the current CSRF token in a cookie jar."""
+    return next(
+        cookie.value for cookie in cookies if cookie.name == 'csrftoken')
+
+
+def http_login(base_url, username, password, timeout=30):
+    """Log in through the login form.
+
+    Return a cookie-keeping opener and its cookie jar.  Logging in, or
+    signing up, rotates the CSRF token, so read it with csrf_token() before
+    each form post.
+    """
+    cookies = http.cookiejar.CookieJar()
+    opener = urllib.request.build_opener(
+        urllib.request.HTTPCookieProcessor(cookies))
+    login_url = base_url + '/accounts/login/'
+    opener.open(login_url, timeout=timeout).read()
+    opener.open(login_url, urllib.parse.urlencode({
+        'username': username, 'password': password,
+        'csrfmiddlewaretoken': csrf_token(cookies),
+    }).encode(), timeout=timeout).read()
+    return opener, cookies
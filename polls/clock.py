@@ -0,0 +1,15 @@
+"""This module contains the request-scoped clock of the application."""
+from django.utils import timezone
+
+
+def request_now(request):
+    """Return the time of a request, reading the clock once per request.
+
+    Every status check made while serving the request compares against this
+    same instant, so a poll cannot be open in one place and closed in another.
+    """
+    try:
+        return request.polls_now
+    except AttributeError:
+        request.polls_now = timezone.now()
+        return request.polls_now
@@ -0,0 +1,139 @@
+"""This module contains the pub/sub that drives live results streams.
+
+A broker keeps a change counter per question.  Publishers bump it when a
+question's tally changes; subscribers remember the last counter they saw and
+wait for it to move, so any number of changes between two waits wake a
+subscriber only once.  The broker class is chosen by RESULTS_EVENT_BROKER and
+can be replaced by one backed by an external message bus that implements the
+same three methods.
+
+Streams are async generators: a waiting stream holds no thread and no
+database connection, so they need an ASGI server (RESULTS_STREAM_ENABLED).
+"""
+import asyncio
+import json
+import threading
+import time
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.utils.module_loading import import_string
+
+from .models import Question
+from .results import cached_tally
+
+
+class LocalBroker:
+    """An in-process broker for a single server process."""
+
+    def __init__(self):
+        """Create a broker with no changes recorded."""
+        self._changes = {}
+        self._waiters = {}
+        self._lock = threading.Lock()
+
+    def publish(self, question_id):
+        """Record a change of a question and wake its subscribers.
+
+        Publishers run in sync code, often another thread, so each waiter is
+        woken through the event loop it is waiting on.
+        """
+        with self._lock:
+            self._changes[question_id] = self._changes.get(question_id, 0) + 1
+            waiters = self._waiters.pop(question_id, set())
+        for loop, future in waiters:
+            try:
+                loop.call_soon_threadsafe(_wake, future)
+            except RuntimeError:
+                # The waiter's event loop has already been closed.
+                pass
+
+    def version(self, question_id):
+        """Return the change counter of a question."""
+        with self._lock:
+            return self._changes.get(question_id, 0)
+
+    async def wait(self, question_id, seen, timeout):
+        """Wait until the counter differs from seen or timeout passes.
+
+        Return the current counter, which equals seen on a timeout.
+        """
+        loop = asyncio.get_running_loop()
+        waiter = (loop, loop.create_future())
+        with self._lock:
+            if self._changes.get(question_id, 0) != seen:
+                return self._changes[question_id]
+            self._waiters.setdefault(question_id, set()).add(waiter)
+        try:
+            await asyncio.wait_for(waiter[1], timeout)
+        except asyncio.TimeoutError:
+            pass
+        finally:
+            with self._lock:
+                self._waiters.get(question_id, set()).discard(waiter)
+        return self.version(question_id)
+
+
+def _wake(future):
+    """Resolve a waiter's future unless it was cancelled meanwhile."""
+    if not future.done():
+        future.set_result(None)
+
+
+_broker = None
+_broker_lock = threading.Lock()
+
+
+def broker():
+    """Return the process-wide broker named by RESULTS_EVENT_BROKER."""
+    global _broker
+    with _broker_lock:
+        if _broker is None:
+            _broker = import_string(settings.RESULTS_EVENT_BROKER)()
+    return _broker
+
+
+def _event(results, sent):
+    """Return the SSE message for the choices whose count changed."""
+    total = sum(result.votes for result in results)
+    changed = {
+        result.id: {'votes': result.votes, 'percentage': result.percentage,
+                    'is_winner': result.is_winner}
+        for result in results if sent.get(result.id) != result
+    }
+    payload = json.dumps({'total': total, 'choices': changed})
+    return f'event: tally\ndata: {payload}\n\n'
+
+
+def _current_tally(question_id):
+    """Return whether a question is still open and its current tally."""
+    question = Question.objects.with_status().get(pk=question_id)
+    return question.can_vote(), cached_tally(question)
+
+
+async def tally_events(question_id):
+    """Yield Server-Sent Events with the tally deltas of a question.
+
+    The first event carries every choice.  Later events are sent at most once
+    per RESULTS_STREAM_INTERVAL seconds and only name choices whose result
+    changed; a comment line is sent every RESULTS_STREAM_HEARTBEAT seconds
+    without changes to keep the connection open.  The stream ends once the
+    question closes.
+    """
+    events = broker()
+    seen = events.version(question_id)
+    sent = {}
+    while True:
+        is_open, results = await sync_to_async(_current_tally)(question_id)
+        if any(sent.get(result.id) != result for result in results):
+            yield _event(results, sent)
+            sent = {result.id: result for result in results}
+        else:
+            yield ': keep-alive\n\n'
+        if not is_open:
+            return
+        pushed = time.monotonic()
+        seen = await events.wait(question_id, seen,
+                                 settings.RESULTS_STREAM_HEARTBEAT)
+        await asyncio.sleep(max(0, pushed + settings.RESULTS_STREAM_INTERVAL
+                                - time.monotonic()))
@@ -0,0 +1,131 @@
+"""This module contains the buffered vote ingestion path.
+
+When VOTE_BUFFER_ENABLED is set, the vote view hands ballots to a process-wide
+VoteBuffer instead of writing them itself.  A background thread flushes the
+buffer every VOTE_BUFFER_FLUSH_INTERVAL seconds, or as soon as
+VOTE_BUFFER_BATCH_SIZE ballots are waiting, and the buffer is drained when the
+process exits.
+"""
+import atexit
+import logging
+import threading
+
+from django.conf import settings
+from django.db import DataError, IntegrityError, close_old_connections
+
+from .models import Votes
+
+logger = logging.getLogger(__name__)
+
+
+class VoteBuffer:
+    """Collect ballots in memory and write them to the database in batches.
+
+    Ballots are keyed by (user_id, question_id), so a user who votes twice
+    before a flush only has the latest choice written.
+    """
+
+    def __init__(self, batch_size, flush_interval):
+        """Create an empty buffer; call start() to flush in the background."""
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self._pending = {}
+        self._lock = threading.Lock()
+        self._flush_lock = threading.Lock()
+        self._wakeup = threading.Event()
+        self._stopped = threading.Event()
+        self._thread = None
+
+    def __len__(self):
+        """Return the number of ballots waiting to be flushed."""
+        return len(self._pending)
+
+    def submit(self, user_id, question_id, choice_id):
+        """Queue a ballot, waking the flusher once a full batch is waiting."""
+        with self._lock:
+            self._pending[(user_id, question_id)] = choice_id
+            full = len(self._pending) >= self.batch_size
+        if full:
+            self._wakeup.set()
+
+    def flush(self):
+        """Write every waiting ballot and return the number of rows written.
+
+        If the batch is rejected, e.g. because a choice was deleted, the
+        ballots are written one at a time and the rejected ones are dropped.
+        If the write fails otherwise the ballots are queued again, unless the
+        same user has voted on that question again in the meantime.
+        """
+        with self._flush_lock:
+            with self._lock:
+                ballots, self._pending = self._pending, {}
+            try:
+                return Votes.objects.cast_many(ballots)
+            except (DataError, IntegrityError):
+                return self._flush_one_by_one(ballots)
+            except Exception:
+                self._requeue(ballots)
+                raise
+
+    def _flush_one_by_one(self, ballots):
+        """Write ballots separately, dropping those the database rejects."""
+        written = 0
+        keys = list(ballots)
+        for index, key in enumerate(keys):
+            try:
+                written += Votes.objects.cast_many({key: ballots[key]})
+            except (DataError, IntegrityError):
+                logger.warning('Dropped the vote of user %s on question %s '
+                               'for choice %s.', *key, ballots[key],
+                               exc_info=True)
+            except Exception:
+                self._requeue({key: ballots[key] for key in keys[index:]})
+                raise
+        return written
+
+    def _requeue(self, ballots):
+        """Queue ballots again, keeping any newer ballot of the same user."""
+        with self._lock:
+            for key, choice_id in ballots.items():
+                self._pending.setdefault(key, choice_id)
+
+    def start(self):
+        """Start the background flusher thread."""
+        self._thread = threading.Thread(
+            target=self._run, name='vote-buffer', daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        """Stop the flusher and write whatever is still waiting."""
+        self._stopped.set()
+        self._wakeup.set()
+        if self._thread is not None:
+            self._thread.join()
+        self.flush()
+
+    def _run(self):
+        """Flush on every interval or full batch until stopped."""
+        while not self._stopped.is_set():
+            self._wakeup.wait(self.flush_interval)
+            self._wakeup.clear()
+            close_old_connections()
+            try:
+                self.flush()
+            except Exception:
+                logger.exception('Could not flush the vote buffer.')
+
+
+_buffer = None
+_buffer_lock = threading.Lock()
+
+
+def vote_buffer():
+    """Return the process-wide VoteBuffer, starting it on first use."""
+    global _buffer
+    with _buffer_lock:
+        if _buffer is None:
+            _buffer = VoteBuffer(settings.VOTE_BUFFER_BATCH_SIZE,
+                                 settings.VOTE_BUFFER_FLUSH_INTERVAL)
+            _buffer.start()
+            atexit.register(_buffer.stop)
+    return _buffer
@@ -0,0 +1,50 @@
+"""This module contains per-request loaders for user-specific poll data."""
+from .models import Votes
+
+
+class UserVoteLoader:
+    """Load a user's votes for many questions with one query.
+
+    Results are remembered, so asking again for questions that were already
+    loaded during the request does not touch the database.
+    """
+
+    def __init__(self, user):
+        """Create a loader for the given user."""
+        self.user = user
+        self._choices = {}
+
+    def load(self, question_ids):
+        """Return a question_id -> choice_id mapping of the user's votes."""
+        question_ids = set(question_ids)
+        missing = question_ids.difference(self._choices)
+        if missing:
+            self._choices.update(dict.fromkeys(missing))
+            if self.user.is_authenticated:
+                self._choices.update(Votes.objects.filter(
+                    user=self.user, question_id__in=missing,
+                ).values_list('question_id', 'choice_id'))
+        return {pk: self._choices[pk] for pk in question_ids
+                if self._choices[pk] is not None}
+
+    async def aload(self, question_ids):
+        """Return the same mapping as load() using the async ORM."""
+        question_ids = set(question_ids)
+        missing = question_ids.difference(self._choices)
+        if missing:
+            self._choices.update(dict.fromkeys(missing))
+            if self.user.is_authenticated:
+                async for question_id, choice_id in Votes.objects.filter(
+                    user=self.user, question_id__in=missing,
+                ).values_list('question_id', 'choice_id'):
+                    self._choices[question_id] = choice_id
+        return {pk: self._choices[pk] for pk in question_ids
+                if self._choices[pk] is not None}
+
+
+def vote_loader(request):
+    """Return the UserVoteLoader of the current request."""
+    loader = getattr(request, '_vote_loader', None)
+    if loader is None:
+        loader = request._vote_loader = UserVoteLoader(request.user)
+    return loader
@@ -0,0 +1,195 @@
+"""This module contains the end-to-end benchmark of the polls application."""
+import json
+import random
+import threading
+import urllib.parse
+
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.test import Client, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+
+from polls.bench import csrf_token, drive, http_login
+from polls.models import Choice, Question
+from polls.seeding import seed_polls
+
+PREFIX = 'bench'
+PASSWORD = 'bench-password'
+TARGETS = ('index', 'detail', 'results', 'vote', 'signup')
+METRICS = ('rps', 'p50_ms', 'p95_ms', 'p99_ms', 'queries_per_request')
+
+
+class Command(BaseCommand):
+    """Seed a dataset, load every endpoint and report latency and queries."""
+
+    help = ('Seed synthetic polls, drive the index, detail, results, vote '
+            'and signup endpoints through the test client or a running '
+            'server, and report throughput, latency percentiles and queries '
+            'per request.')
+
+    def add_arguments(self, parser):
+        """Accept the dataset shape, the load and the report files."""
+        parser.add_argument('--questions', type=int, default=200)
+        parser.add_argument('--choices', type=int, default=4)
+        parser.add_argument('--users', type=int, default=200)
+        parser.add_argument('--turnout', type=float, default=0.3)
+        parser.add_argument('--skew', type=float, default=1.0)
+        parser.add_argument('--requests', type=int, default=500)
+        parser.add_argument('--concurrency', type=int, default=4)
+        parser.add_argument('--target', action='append', choices=TARGETS,
+                            dest='targets', help='Endpoint to load; repeat '
+                            'for several. Defaults to all of them.')
+        parser.add_argument('--base-url', help='Load a running WSGI or ASGI '
+                            'server here instead of the test client; start '
+                            'it with empty VOTE_THROTTLE_RATE and '
+                            'VOTE_IP_THROTTLE_RATE to load votes.')
+        parser.add_argument('--output', help='Write the results as JSON.')
+        parser.add_argument('--baseline', help='Compare with a JSON file '
+                            'written by an earlier --output.')
+        parser.add_argument('--keep', action='store_true',
+                            help='Keep the seeded data afterwards.')
+
+    def handle(self, *args, **options):
+        """Seed, run each target, report and clean up."""
+        if User.objects.filter(username__startswith=f'{PREFIX}_user_').exists():
+            raise CommandError('Benchmark data already exists; remove it or '
+                               'run without --keep first.')
+        try:
+            seed_polls(questions=options['questions'],
+                       choices=options['choices'], users=options['users'],
+                       turnout=options['turnout'], skew=options['skew'],
+                       password=PASSWORD, prefix=PREFIX)
+            self.open_questions = list(Question.objects.open().filter(
+                question_text__startswith=f'{PREFIX} question ',
+                choice__isnull=False).distinct().values_list('pk', flat=True))
+            self.choices = {}
+            for pk, question_id in Choice.objects.filter(
+                    question_id__in=self.open_questions).values_list(
+                    'pk', 'question_id'):
+                self.choices.setdefault(question_id, []).append(pk)
+            self.usernames = list(User.objects.filter(
+                username__startswith=f'{PREFIX}_user_').values_list(
+                'username', flat=True))
+            self.user_counter = 0
+            self.user_lock = threading.Lock()
+            hosts = [*settings.ALLOWED_HOSTS, 'testserver']
+            with override_settings(ALLOWED_HOSTS=hosts, THROTTLE_RATES={},
+                                   THROTTLE_IP_RATES={}):
+                report = {target: self.run_target(target, options)
+                          for target in options['targets'] or TARGETS}
+        finally:
+            if not options['keep']:
+                User.objects.filter(
+                    username__startswith=f'{PREFIX}_user_').delete()
+                Question.objects.filter(
+                    question_text__startswith=f'{PREFIX} question ').delete()
+        self.print_report(report, options['baseline'])
+        if options['output']:
+            with open(options['output'], 'w') as output:
+                json.dump({'options': {key: options[key] for key in (
+                    'questions', 'choices', 'users', 'turnout', 'skew',
+                    'requests', 'concurrency', 'base_url')},
+                    'results': report}, output, indent=2)
+
+    def run_target(self, target, options):
+        """Load one endpoint and return its summary."""
+        make_request = getattr(self, f'request_{target}')
+        if options['base_url']:
+            fetch = self.http_fetcher(make_request, options['base_url'])
+        else:
+            fetch = self.client_fetcher(make_request)
+        return drive(fetch, options['requests'], options['concurrency'])
+
+    def request_index(self, rng):
+        """Return the method, path and data of an index request."""
+        return 'GET', reverse('polls:index'), None
+
+    def request_detail(self, rng):
+        """Return the method, path and data of a detail request."""
+        question = rng.choice(self.open_questions)
+        return 'GET', reverse('polls:detail', args=(question,)), None
+
+    def request_results(self, rng):
+        """Return the method, path and data of a results request."""
+        question = rng.choice(self.open_questions)
+        return 'GET', reverse('polls:results', args=(question,)), None
+
+    def request_vote(self, rng):
+        """Return the method, path and data of a vote request."""
+        question = rng.choice(self.open_questions)
+        return 'POST', reverse('polls:vote', args=(question,)), {
+            'choice': rng.choice(self.choices[question])}
+
+    def request_signup(self, rng):
+        """Return the method, path and data of a signup request."""
+        username = f'{PREFIX}_user_new_{rng.getrandbits(64):x}'
+        return 'POST', reverse('signup'), {
+            'username': username, 'password1': PASSWORD,
+            'password2': PASSWORD}
+
+    def next_user(self):
+        """Return a different seeded username for each worker thread."""
+        with self.user_lock:
+            self.user_counter += 1
+            return self.usernames[self.user_counter % len(self.usernames)]
+
+    def client_fetcher(self, make_request):
+        """Return a fetch function that uses a logged in test client."""
+        local = threading.local()
+
+        def fetch(number):
+            if not hasattr(local, 'client'):
+                local.client = Client()
+                local.client.force_login(
+                    User.objects.get(username=self.next_user()))
+                local.rng = random.Random(number)
+            method, path, data = make_request(local.rng)
+            with CaptureQueriesContext(connection) as queries:
+                if method == 'POST':
+                    response = local.client.post(path, data)
+                else:
+                    response = local.client.get(path)
+            if response.status_code >= 400:
+                raise RuntimeError(f'{path} answered {response.status_code}')
+            return len(queries.captured_queries)
+        return fetch
+
+    def http_fetcher(self, make_request, base_url):
+        """Return a fetch function that logs in to a running server."""
+        local = threading.local()
+
+        def fetch(number):
+            if not hasattr(local, 'opener'):
+                local.opener, local.cookies = http_login(
+                    base_url, self.next_user(), PASSWORD)
+                local.rng = random.Random(number)
+            method, path, data = make_request(local.rng)
+            body = None
+            if method == 'POST':
+                token = csrf_token(local.cookies)
+                body = urllib.parse.urlencode(
+                    {**data, 'csrfmiddlewaretoken': token}).encode()
+            with local.opener.open(base_url + path, body, timeout=30) as page:
+                page.read()
+        return fetch
+
+    def print_report(self, report, baseline_path):
+        """Print one line per target, with changes against a baseline."""
+        baseline = {}
+        if baseline_path:
+            with open(baseline_path) as previous:
+                baseline = json.load(previous)['results']
+        for target, stats in report.items():
+            line = [f'{target:8}']
+            for metric in METRICS:
+                if metric not in stats:
+                    continue
+                line.append(f'{metric} {stats[metric]:9.2f}')
+                old = baseline.get(target, {}).get(metric)
+                if old:
+                    line.append(f'({(stats[metric] - old) / old:+.0%})')
+            line.append(f'errors {stats["errors"]}')
+            self.stdout.write('  '.join(line))
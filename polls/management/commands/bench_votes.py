@@ -0,0 +1,65 @@
+"""This module contains a benchmark of the vote ingestion paths."""
+import random
+import time
+
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+
+from polls.ingest import VoteBuffer
+from polls.models import Question, Votes
+
+
+class Command(BaseCommand):
+    """Compare votes per second of the synchronous and buffered paths."""
+
+    help = ('Cast the same votes through Votes.objects.cast() and through a '
+            'VoteBuffer and report votes per second for each.')
+
+    def add_arguments(self, parser):
+        """Accept the size of the benchmark."""
+        parser.add_argument('--votes', type=int, default=2000)
+        parser.add_argument('--choices', type=int, default=4)
+        parser.add_argument('--batch-size', type=int, default=500)
+        parser.add_argument('--seed', type=int, default=0)
+
+    def handle(self, *args, **options):
+        """Seed a throwaway question and users, time both paths, clean up."""
+        rng = random.Random(options['seed'])
+        question = Question.objects.create(
+            question_text='bench_votes', pub_date=timezone.now())
+        try:
+            choices = [question.choice_set.create(choice_text=f'choice {i}')
+                       for i in range(options['choices'])]
+            User.objects.bulk_create(
+                User(username=f'bench_votes_{i}')
+                for i in range(options['votes']))
+            users = list(User.objects.filter(
+                username__startswith='bench_votes_'))
+            ballots = [(user, rng.choice(choices)) for user in users]
+
+            started = time.perf_counter()
+            for user, choice in ballots:
+                Votes.objects.cast(user, choice)
+            sync_rate = len(ballots) / (time.perf_counter() - started)
+
+            Votes.objects.filter(question=question).delete()
+            question.choice_set.update(vote_count=0)
+
+            buffer = VoteBuffer(options['batch_size'], flush_interval=None)
+            started = time.perf_counter()
+            for user, choice in ballots:
+                buffer.submit(user.pk, question.pk, choice.pk)
+                if len(buffer) >= buffer.batch_size:
+                    buffer.flush()
+            buffer.flush()
+            buffered_rate = len(ballots) / (time.perf_counter() - started)
+        finally:
+            User.objects.filter(username__startswith='bench_votes_').delete()
+            question.delete()
+
+        self.stdout.write(f'synchronous: {sync_rate:10.0f} votes/s')
+        self.stdout.write(f'buffered:    {buffered_rate:10.0f} votes/s '
+                          f'(batch size {options["batch_size"]})')
+        self.stdout.write(self.style.SUCCESS(
+            f'speedup: {buffered_rate / sync_rate:.1f}x'))
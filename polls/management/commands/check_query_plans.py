@@ -0,0 +1,78 @@
+"""This module contains a command that checks the plans of the hot queries."""
+import re
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
+from django.utils import timezone
+
+from polls.models import Choice, Question, Votes
+from polls.seeding import seed_polls
+
+# A table scan that is neither driven by an index nor followed by a lookup.
+FULL_SCAN = re.compile(r'\bSCAN (\w+)(?! USING (?:COVERING )?INDEX)')
+TEMP_SORT = re.compile(r'USE TEMP B-TREE FOR ORDER BY')
+
+
+class _Rollback(Exception):
+    """Raised to discard the seeded rows once the plans are checked."""
+
+
+class Command(BaseCommand):
+    """Run EXPLAIN QUERY PLAN on the hot queries against seeded data."""
+
+    help = ('Seed a large dataset in a transaction that is rolled back, print '
+            'the query plan of every hot lookup and fail on a full scan.')
+
+    def add_arguments(self, parser):
+        """Accept the size of the seeded dataset."""
+        parser.add_argument('--questions', type=int, default=2000)
+        parser.add_argument('--users', type=int, default=200)
+        parser.add_argument('--turnout', type=float, default=0.05)
+
+    def hot_queries(self):
+        """Return (name, queryset) pairs for the lookups the views issue."""
+        question = Question.objects.filter(
+            pub_date__lte=timezone.now()).latest('pub_date')
+        vote = Votes.objects.filter(question=question).first() or Votes(
+            user_id=0, choice_id=0)
+        choice_ids = question.choice_set.values('pk')
+        return [
+            ('index listing', Question.objects.with_status().published().page(
+                10, after=(question.pub_date, question.pk))),
+            ('open polls listing', Question.objects.open().page(10)),
+            ('vote of user on question', Votes.objects.filter(
+                user_id=vote.user_id, question=question)),
+            ('previous votes of a batch', Votes.objects.filter(
+                user_id__in=[vote.user_id], question_id__in=[question.pk])),
+            ('votes of a choice', Votes.objects.filter(
+                choice_id=vote.choice_id)),
+            ('choices of a question', Choice.objects.filter(
+                question=question).order_by('pk')),
+            ('counter drift', Choice.objects.filter(
+                pk__in=choice_ids).out_of_sync()),
+        ]
+
+    def handle(self, *args, **options):
+        """Seed, explain each hot query, then roll the seed back."""
+        if connection.vendor != 'sqlite':
+            raise CommandError('EXPLAIN QUERY PLAN is only checked on SQLite.')
+        failures = []
+        try:
+            with transaction.atomic():
+                seed_polls(questions=options['questions'],
+                           users=options['users'],
+                           turnout=options['turnout'], prefix='query_plans')
+                with connection.cursor() as cursor:
+                    cursor.execute('ANALYZE')
+                for name, queryset in self.hot_queries():
+                    plan = queryset.explain()
+                    self.stdout.write(f'{name}:\n{plan}\n')
+                    if FULL_SCAN.search(plan) or TEMP_SORT.search(plan):
+                        failures.append(name)
+                raise _Rollback
+        except _Rollback:
+            pass
+        if failures:
+            raise CommandError(
+                'Full scan or sort in: ' + ', '.join(failures))
+        self.stdout.write(self.style.SUCCESS('All hot queries use indexes.'))
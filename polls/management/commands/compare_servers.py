@@ -0,0 +1,131 @@
+"""This module contains a load test of the app under ASGI and WSGI servers."""
+import os
+import random
+import shutil
+import subprocess
+import sys
+import threading
+import urllib.parse
+
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+from django.urls import reverse
+
+from polls.bench import csrf_token, drive, http_login, wait_until_up
+from polls.models import Question
+from polls.seeding import seed_polls
+
+PREFIX = 'compare'
+PASSWORD = 'compare-password'
+SERVERS = {
+    # name: (argv, environment overrides)
+    'asgi': (['uvicorn', 'mysite.asgi:application', '--log-level', 'warning',
+              '--host', '127.0.0.1', '--port', '{port}',
+              '--workers', '{workers}'], {'ASYNC_VIEWS': 'True'}),
+    'wsgi': (['gunicorn', 'mysite.wsgi:application', '--log-level', 'warning',
+              '--bind', '127.0.0.1:{port}',
+              '--workers', '{workers}'], {'ASYNC_VIEWS': 'False'}),
+}
+
+
+class Command(BaseCommand):
+    """Compare throughput under uvicorn and gunicorn at equal worker counts."""
+
+    help = ('Start the project under uvicorn (async views) and gunicorn '
+            '(sync views) in turn and load the same pages on each: by '
+            'default the detail, results and vote pages of a seeded poll, '
+            'the ones ASYNC_VIEWS switches to async views.')
+
+    def add_arguments(self, parser):
+        """Accept the load shape and the paths to request."""
+        parser.add_argument('paths', nargs='*', help='Paths to GET instead '
+                            'of the detail, results and vote pages.')
+        parser.add_argument('--workers', type=int, default=2)
+        parser.add_argument('--concurrency', type=int, default=32)
+        parser.add_argument('--requests', type=int, default=1000)
+        parser.add_argument('--port', type=int, default=8765)
+
+    def handle(self, *args, **options):
+        """Seed a poll, run every server in turn and print one line a page."""
+        missing = [argv[0] for argv, _ in SERVERS.values()
+                   if shutil.which(argv[0]) is None]
+        if missing:
+            raise CommandError(
+                'Install the servers to compare: pip install '
+                + ' '.join(missing))
+        seeded = User.objects.filter(username__startswith=f'{PREFIX}_user_')
+        if seeded.exists():
+            raise CommandError('Comparison data already exists; remove it '
+                               'first.')
+        self.user_counter = 0
+        self.user_lock = threading.Lock()
+        try:
+            seed_polls(questions=3, users=options['concurrency'], turnout=0,
+                       password=PASSWORD, prefix=PREFIX)
+            self.usernames = list(
+                seeded.values_list('username', flat=True))
+            question = Question.objects.open().get(
+                question_text__startswith=f'{PREFIX} question ')
+            self.choices = list(
+                question.choice_set.values_list('pk', flat=True))
+            pages = [('GET', path) for path in options['paths']] or [
+                ('GET', reverse('polls:detail', args=(question.pk,))),
+                ('GET', reverse('polls:results', args=(question.pk,))),
+                ('POST', reverse('polls:vote', args=(question.pk,))),
+            ]
+            self.compare(pages, options)
+        finally:
+            seeded.delete()
+            Question.objects.filter(
+                question_text__startswith=f'{PREFIX} question ').delete()
+
+    def compare(self, pages, options):
+        """Load every page under each server and print the results."""
+        base = f'http://127.0.0.1:{options["port"]}'
+        for name, (argv, env) in SERVERS.items():
+            argv = [arg.format(port=options['port'],
+                               workers=options['workers']) for arg in argv]
+            # Every request is one of a few users, so turn throttling off.
+            server = subprocess.Popen(
+                argv, env={**os.environ, 'ALLOWED_HOSTS': '127.0.0.1',
+                           'VOTE_THROTTLE_RATE': '',
+                           'VOTE_IP_THROTTLE_RATE': '', **env},
+                stdout=sys.stderr)
+            try:
+                wait_until_up(base + reverse('login'))
+                for method, path in pages:
+                    stats = drive(self.http_fetcher(base, method, path),
+                                  options['requests'], options['concurrency'])
+                    self.stdout.write(
+                        f'{name} {method} {path}: {stats["rps"]:8.1f} req/s  '
+                        f'p50 {stats["p50_ms"]:.1f} ms  '
+                        f'p99 {stats["p99_ms"]:.1f} ms  '
+                        f'errors {stats["errors"]}')
+            finally:
+                server.terminate()
+                server.wait()
+
+    def next_user(self):
+        """Return a different seeded username for each worker thread."""
+        with self.user_lock:
+            self.user_counter += 1
+            return self.usernames[self.user_counter % len(self.usernames)]
+
+    def http_fetcher(self, base_url, method, path):
+        """Return a fetch function that loads a page as a logged in user."""
+        local = threading.local()
+
+        def fetch(number):
+            if not hasattr(local, 'opener'):
+                local.opener, local.cookies = http_login(
+                    base_url, self.next_user(), PASSWORD)
+                local.rng = random.Random(number)
+            body = None
+            if method == 'POST':
+                body = urllib.parse.urlencode({
+                    'choice': local.rng.choice(self.choices),
+                    'csrfmiddlewaretoken': csrf_token(local.cookies),
+                }).encode()
+            with local.opener.open(base_url + path, body, timeout=30) as page:
+                page.read()
+        return fetch
@@ -0,0 +1,44 @@
+"""This module contains a command that streams votes out to a file."""
+import sys
+
+from django.core.management.base import BaseCommand
+
+from polls.models import Votes
+from polls.transfer import FORMATS, guess_format, write_votes
+
+
+class Command(BaseCommand):
+    """Export votes as JSON Lines or CSV in bounded memory."""
+
+    help = 'Stream every vote to a JSONL or CSV file, or to stdout.'
+
+    def add_arguments(self, parser):
+        """Accept the output file, its format and the export scope."""
+        parser.add_argument('path', nargs='?', default='-',
+                            help='Output file, or - for stdout.')
+        parser.add_argument('--format', choices=FORMATS)
+        parser.add_argument('--chunk-size', type=int, default=2000)
+        parser.add_argument('--question', type=int, action='append',
+                            dest='questions', help='Only export this question.')
+
+    def handle(self, *args, **options):
+        """Write the votes chunk by chunk, reporting progress on stderr."""
+        path, chunk_size = options['path'], options['chunk_size']
+        fmt = options['format'] or guess_format(path)
+        votes = Votes.objects.order_by('pk')
+        if options['questions']:
+            votes = votes.filter(question_id__in=options['questions'])
+        rows = votes.values_list(
+            'user__username', 'question_id', 'choice_id').iterator(
+            chunk_size=chunk_size)
+        stream = (sys.stdout if path == '-'
+                  else open(path, 'w', newline='', encoding='utf-8'))
+        count = 0
+        try:
+            for count in write_votes(stream, fmt, rows):
+                if count % chunk_size == 0:
+                    self.stderr.write(f'Exported {count} votes...')
+        finally:
+            if stream is not sys.stdout:
+                stream.close()
+        self.stderr.write(self.style.SUCCESS(f'Exported {count} votes.'))
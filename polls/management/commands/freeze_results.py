@@ -0,0 +1,36 @@
+"""This module contains a command that snapshots the results of closed polls."""
+
+from django.core.management.base import BaseCommand
+from django.db.models import F, Q
+
+from polls.models import Question
+from polls.results import freeze
+
+
+class Command(BaseCommand):
+    """Freeze the final tally of every closed question without a snapshot."""
+
+    help = ('Store the results of closed polls as snapshots, so their '
+            'results pages no longer tally the votes.')
+
+    def add_arguments(self, parser):
+        """Accept an optional list of question ids to limit the freeze."""
+        parser.add_argument(
+            'question_ids', nargs='*', type=int,
+            help='Only freeze these questions.')
+
+    def handle(self, *args, **options):
+        """Freeze the closed questions whose snapshot is missing or stale."""
+        questions = Question.objects.closed()
+        if options['question_ids']:
+            questions = questions.filter(pk__in=options['question_ids'])
+        stale = questions.filter(
+            Q(snapshot__isnull=True) |
+            ~Q(snapshot__closed_at=F('end_date')) |
+            ~Q(snapshot__vote_version=F('vote_version')))
+        frozen = 0
+        for question in stale.iterator():
+            freeze(question)
+            frozen += 1
+        self.stdout.write(self.style.SUCCESS(
+            f'Froze {frozen} of {questions.count()} closed questions.'))
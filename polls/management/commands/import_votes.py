@@ -0,0 +1,64 @@
+"""This module contains a command that streams votes in from a file."""
+import sys
+from itertools import islice
+
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand
+
+from polls.models import Choice, Votes
+from polls.transfer import FORMATS, guess_format, read_votes
+
+
+class Command(BaseCommand):
+    """Import votes from JSON Lines or CSV in bounded memory."""
+
+    help = ('Stream votes from a JSONL or CSV file, or stdin, and upsert them '
+            'in chunked transactions.')
+
+    def add_arguments(self, parser):
+        """Accept the input file, its format and the chunk size."""
+        parser.add_argument('path', nargs='?', default='-',
+                            help='Input file, or - for stdin.')
+        parser.add_argument('--format', choices=FORMATS)
+        parser.add_argument('--chunk-size', type=int, default=2000)
+
+    def resolve(self, chunk):
+        """Turn a chunk of records into ballots with two bulk lookups.
+
+        Return the ballots and the number of records that name an unknown
+        user or a choice that does not belong to the question.
+        """
+        users = dict(User.objects.filter(
+            username__in={username for username, _, _ in chunk},
+        ).values_list('username', 'pk'))
+        questions = dict(Choice.objects.filter(
+            pk__in={choice_id for _, _, choice_id in chunk},
+        ).values_list('pk', 'question_id'))
+        ballots, skipped = {}, 0
+        for username, question_id, choice_id in chunk:
+            if username in users and questions.get(choice_id) == question_id:
+                ballots[(users[username], question_id)] = choice_id
+            else:
+                skipped += 1
+        return ballots, skipped
+
+    def handle(self, *args, **options):
+        """Read, resolve and upsert the votes one chunk at a time."""
+        path, chunk_size = options['path'], options['chunk_size']
+        fmt = options['format'] or guess_format(path)
+        stream = (sys.stdin if path == '-'
+                  else open(path, newline='', encoding='utf-8'))
+        read = written = skipped = 0
+        try:
+            records = read_votes(stream, fmt)
+            while chunk := list(islice(records, chunk_size)):
+                ballots, rejected = self.resolve(chunk)
+                written += Votes.objects.cast_many(ballots)
+                read += len(chunk)
+                skipped += rejected
+                self.stderr.write(f'Read {read} votes...')
+        finally:
+            if stream is not sys.stdin:
+                stream.close()
+        self.stderr.write(self.style.SUCCESS(
+            f'Imported {written} votes, skipped {skipped} of {read}.'))
@@ -0,0 +1,28 @@
+"""This module contains a command that rebuilds the stored vote counters."""
+
+from django.core.management.base import BaseCommand
+
+from polls.models import Choice
+
+
+class Command(BaseCommand):
+    """Recount Choice.vote_count from the Votes table."""
+
+    help = 'Rebuild the stored per-choice vote counters from the votes.'
+
+    def add_arguments(self, parser):
+        """Accept an optional list of question ids to limit the rebuild."""
+        parser.add_argument(
+            'question_ids', nargs='*', type=int,
+            help='Only reconcile the choices of these questions.')
+
+    def handle(self, *args, **options):
+        """Report the drifted choices, then recount them in one UPDATE."""
+        choices = Choice.objects.all()
+        if options['question_ids']:
+            choices = choices.filter(question_id__in=options['question_ids'])
+        drifted = list(choices.out_of_sync().values_list('pk', flat=True))
+        if drifted:
+            Choice.objects.filter(pk__in=drifted).refresh_vote_counts()
+        self.stdout.write(self.style.SUCCESS(
+            f'Reconciled {len(drifted)} of {choices.count()} choices.'))
@@ -0,0 +1,29 @@
+from django.db import migrations, models
+from django.db.models import Count, OuterRef, Subquery
+from django.db.models.functions import Coalesce
+
+
+def count_existing_votes(apps, schema_editor):
+    """Fill the new counter column from the existing Votes rows."""
+    Choice = apps.get_model('polls', 'Choice')
+    Votes = apps.get_model('polls', 'Votes')
+    counted = Votes.objects.filter(choice=OuterRef('pk')).order_by()
+    counted = counted.values('choice').annotate(total=Count('id'))
+    Choice.objects.update(
+        vote_count=Coalesce(Subquery(counted.values('total')), 0))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('polls', '0004_remove_choice_votes_votes'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='choice',
+            name='vote_count',
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+        migrations.RunPython(count_existing_votes, migrations.RunPython.noop),
+    ]
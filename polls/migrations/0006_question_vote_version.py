@@ -0,0 +1,18 @@
+# Generated by Django 4.2.30 on 2026-10-18 02:31
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('polls', '0005_choice_vote_count'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='question',
+            name='vote_version',
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+    ]
@@ -0,0 +1,53 @@
+# Generated by Django 4.2.30 on 2026-10-18 02:34
+
+from django.db import migrations, models
+from django.db.models import Count, Max, OuterRef, Subquery
+from django.db.models.functions import Coalesce
+import django.db.models.deletion
+
+
+def backfill_question(apps, schema_editor):
+    """Copy each vote's question from its choice and drop duplicate votes.
+
+    Only the newest vote of a user on a question is kept, then the stored
+    counters are recounted from the remaining rows.
+    """
+    Choice = apps.get_model('polls', 'Choice')
+    Votes = apps.get_model('polls', 'Votes')
+    Votes.objects.update(question_id=Subquery(
+        Choice.objects.filter(pk=OuterRef('choice_id')).values('question_id')))
+    newest = Votes.objects.values('user_id', 'question_id').annotate(
+        newest=Max('id'), total=Count('id')).filter(total__gt=1)
+    for row in newest:
+        Votes.objects.filter(
+            user_id=row['user_id'], question_id=row['question_id'],
+        ).exclude(pk=row['newest']).delete()
+    counted = Votes.objects.filter(choice=OuterRef('pk')).order_by()
+    counted = counted.values('choice').annotate(total=Count('id'))
+    Choice.objects.update(
+        vote_count=Coalesce(Subquery(counted.values('total')), 0))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('polls', '0006_question_vote_version'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='votes',
+            name='question',
+            field=models.ForeignKey(null=True, on_delete=django.db.models.deletion.CASCADE, to='polls.question'),
+        ),
+        migrations.RunPython(backfill_question, migrations.RunPython.noop),
+        migrations.AlterField(
+            model_name='votes',
+            name='question',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='polls.question'),
+        ),
+        migrations.AddConstraint(
+            model_name='votes',
+            constraint=models.UniqueConstraint(fields=('user', 'question'), name='one_vote_per_question'),
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 4.2.30 on 2026-10-18 02:54
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('polls', '0009_question_last_vote_at'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='question',
+            name='edit_version',
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+    ]
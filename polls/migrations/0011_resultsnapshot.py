@@ -0,0 +1,25 @@
+# Generated by Django 4.2.30 on 2026-10-18 03:11
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('polls', '0010_question_edit_version'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ResultSnapshot',
+            fields=[
+                ('question', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='snapshot', serialize=False, to='polls.question')),
+                ('closed_at', models.DateTimeField()),
+                ('vote_version', models.PositiveIntegerField()),
+                ('total', models.PositiveIntegerField()),
+                ('choices', models.JSONField()),
+                ('frozen_at', models.DateTimeField(auto_now_add=True)),
+            ],
+        ),
+    ]
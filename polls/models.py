@@ -2,10 +2,93 @@
 import datetime
 
 from django.contrib import admin
-from django.db import models
+from django.db import connections, models, router, transaction
+from django.db.models import (
+    Case, CharField, Count, DateTimeField, F, OuterRef, Q, Subquery, Sum,
+    Value, When)
+from django.db.models.functions import Coalesce
 from django.utils import timezone
 from django.contrib.auth.models import User
 
+from .signals import results_changed
+
+
+def _saved_fields(instance, update_fields, excluded):
+    """Return the fields a save of an existing row may write."""
+    if update_fields is None:
+        update_fields = [field.name for field in instance._meta.concrete_fields
+                         if not field.primary_key]
+    return [name for name in update_fields if name not in excluded]
+
+
+class QuestionQuerySet(models.QuerySet):
+    """A queryset for Question that filters and pages by poll status."""
+
+    UPCOMING = 'upcoming'
+    OPEN = 'open'
+    CLOSED = 'closed'
+    STATUSES = (OPEN, CLOSED, UPCOMING)
+
+    def with_status(self, now=None):
+        """Annotate each question with its status at the given time.
+
+        The time itself is annotated as status_at, so the model's lifecycle
+        methods answer from the row without reading the clock again.
+        """
+        now = now or timezone.now()
+        return self.annotate(
+            status=Case(
+                When(end_date__lt=now, then=Value(self.CLOSED)),
+                When(pub_date__gt=now, then=Value(self.UPCOMING)),
+                default=Value(self.OPEN),
+                output_field=CharField(),
+            ),
+            status_at=Value(now, output_field=DateTimeField()),
+        )
+
+    def with_vote_totals(self):
+        """Annotate each question with the sum of its stored vote counters.
+
+        A correlated subquery is only evaluated for the rows fetched, so a
+        paginated list never aggregates the whole Choice table.
+        """
+        totals = Choice.objects.filter(question=OuterRef('pk')).order_by()
+        totals = totals.values('question').annotate(total=Sum('vote_count'))
+        return self.annotate(
+            total_votes=Coalesce(Subquery(totals.values('total')), 0))
+
+    def published(self, now=None):
+        """Return the questions whose pub_date has passed."""
+        return self.filter(pub_date__lte=now or timezone.now())
+
+    def upcoming(self, now=None):
+        """Return the questions that are not published yet."""
+        return self.filter(pub_date__gt=now or timezone.now())
+
+    def open(self, now=None):
+        """Return the published questions that still accept votes."""
+        now = now or timezone.now()
+        return self.published(now).filter(
+            Q(end_date__isnull=True) | Q(end_date__gte=now))
+
+    def closed(self, now=None):
+        """Return the questions whose end_date has passed."""
+        return self.filter(end_date__lt=now or timezone.now())
+
+    def page(self, size, after=None):
+        """Return up to size + 1 questions, newest first, after a cursor.
+
+        The cursor is the (pub_date, id) pair of the last question already
+        shown, so each page is an index range seek rather than an OFFSET.
+        The extra row only tells the caller whether another page exists.
+        """
+        questions = self
+        if after is not None:
+            pub_date, pk = after
+            questions = questions.filter(
+                Q(pub_date__lt=pub_date) | Q(pub_date=pub_date, pk__lt=pk))
+        return questions.order_by('-pub_date', '-pk')[:size + 1]
+
 
 class Question(models.Model):
     """A model class for Question."""
@@ -13,55 +96,258 @@ class Question(models.Model):
     question_text = models.CharField(max_length=200)
     pub_date = models.DateTimeField('date published')
     end_date = models.DateTimeField('date ended', null=True, blank=True)
+    vote_version = models.PositiveIntegerField(default=0, editable=False)
+    last_vote_at = models.DateTimeField(null=True, editable=False)
+    edit_version = models.PositiveIntegerField(default=0, editable=False)
+
+    objects = QuestionQuerySet.as_manager()
+
+    class Meta:
+        indexes = [
+            # Newest-first listing of published questions, with id as the
+            # tie-breaker for keyset pagination.
+            models.Index(fields=['pub_date', 'id'],
+                         name='polls_question_pub_id_idx'),
+        ]
+
+    def _now(self, now=None):
+        """Return the given time, the annotated status time, or the clock."""
+        return now or getattr(self, 'status_at', None) or timezone.now()
+
+    @admin.display(ordering='status', description='Status')
+    def get_status(self, now=None):
+        """Return whether the question is upcoming, open or closed."""
+        if now is None and getattr(self, 'status', None) is not None:
+            return self.status
+        now = self._now(now)
+        if self.end_date is not None and self.end_date < now:
+            return QuestionQuerySet.CLOSED
+        if self.pub_date > now:
+            return QuestionQuerySet.UPCOMING
+        return QuestionQuerySet.OPEN
 
     @admin.display(
         boolean=True,
         ordering=['pub_date', 'end_date'],
         description='Published recently?'
     )
-    def was_published_recently(self):
+    def was_published_recently(self, now=None):
         """Return a boolean whether the question was published recently."""
-        lct = timezone.localtime()
-        return lct - datetime.timedelta(days=1) <= self.pub_date <= lct
+        now = self._now(now)
+        return now - datetime.timedelta(days=1) <= self.pub_date <= now
 
-    def is_published(self):
+    @admin.display(ordering='pub_date')
+    def is_published(self, now=None):
         """Return a boolean whether the question was published."""
-        return self.pub_date <= timezone.localtime()
+        return self.get_status(now) != QuestionQuerySet.UPCOMING
 
-    def can_vote(self):
+    @admin.display(ordering='status')
+    def can_vote(self, now=None):
         """Return a boolean whether the question is within the date."""
-        if self.end_date is None:
-            return timezone.localtime() >= self.pub_date
-        return self.end_date >= timezone.localtime() >= self.pub_date
+        return self.get_status(now) == QuestionQuerySet.OPEN
 
     def __str__(self):
         """Return a Question text."""
         return self.question_text
 
+    def save(self, *args, **kwargs):
+        """Save the question and bump its edit version in the same UPDATE.
+
+        The versions only change relative to their stored values, so an
+        instance loaded before a vote or an edit never rolls them back.
+        """
+        if self.pk is None or self._state.adding:
+            return super().save(*args, **kwargs)
+        kwargs['update_fields'] = _saved_fields(
+            self, kwargs.get('update_fields'),
+            {'vote_version', 'last_vote_at', 'edit_version'})
+        kwargs['update_fields'].append('edit_version')
+        self.edit_version = F('edit_version') + 1
+        try:
+            super().save(*args, **kwargs)
+        finally:
+            # Deferred, so the new value is read back if it is used.
+            del self.__dict__['edit_version']
+
+    @classmethod
+    def bump_vote_version(cls, *question_ids):
+        """Mark the results of questions as changed.
+
+        results_changed is sent once the surrounding transaction commits.
+        """
+        cls.objects.filter(pk__in=question_ids).update(
+            vote_version=F('vote_version') + 1, last_vote_at=timezone.now())
+        transaction.on_commit(lambda: results_changed.send(
+            sender=cls, question_ids=question_ids))
+
+    @classmethod
+    def bump_edit_version(cls, *question_ids):
+        """Mark the text or choices of questions as edited."""
+        cls.objects.filter(pk__in=question_ids).update(
+            edit_version=F('edit_version') + 1)
+
+
+class ChoiceQuerySet(models.QuerySet):
+    """A queryset for Choice that can maintain the stored vote counters."""
+
+    def _counted_votes(self):
+        """Return a subquery counting the Votes rows of each choice."""
+        counted = Votes.objects.filter(choice=OuterRef('pk')).order_by()
+        counted = counted.values('choice').annotate(total=Count('id'))
+        return Coalesce(Subquery(counted.values('total')), 0)
+
+    def out_of_sync(self):
+        """Return the choices whose vote_count differs from the Votes rows."""
+        return self.annotate(counted=self._counted_votes()).exclude(
+            vote_count=F('counted'))
+
+    def refresh_vote_counts(self):
+        """Recount vote_count from the Votes table in a single UPDATE."""
+        return self.update(vote_count=self._counted_votes())
+
+    def recount(self):
+        """Recount these choices and mark their questions' results changed."""
+        self.refresh_vote_counts()
+        question_ids = set(self.values_list('question_id', flat=True))
+        if question_ids:
+            Question.bump_vote_version(*question_ids)
+
 
 class Choice(models.Model):
     """A model class for Choice."""
 
     question = models.ForeignKey(Question, on_delete=models.CASCADE)
     choice_text = models.CharField(max_length=200)
+    vote_count = models.PositiveIntegerField(default=0, editable=False)
+
+    objects = ChoiceQuerySet.as_manager()
+
+    def save(self, *args, **kwargs):
+        """Save the choice without writing back its stored vote counter.
+
+        vote_count only changes through UPDATEs of the stored value, so an
+        instance loaded before a vote must not overwrite it.
+        """
+        if self.pk is not None and not self._state.adding:
+            kwargs['update_fields'] = _saved_fields(
+                self, kwargs.get('update_fields'), {'vote_count'})
+        super().save(*args, **kwargs)
 
     @property
     def votes(self):
-        """Count the numbers of the votes for each choice."""
-        return Votes.objects.filter(choice_id=self.id).count()
+        """Return the stored number of votes for this choice."""
+        return self.vote_count
 
     def __str__(self):
         """Return a choice text."""
         return self.choice_text
 
 
+class VotesManager(models.Manager):
+    """A manager that keeps Choice.vote_count in step with the votes."""
+
+    def cast(self, user, choice):
+        """Record the user's vote for a choice, replacing any earlier one."""
+        return self.cast_many({(user.pk, choice.question_id): choice.pk})
+
+    def cast_many(self, ballots):
+        """Apply a batch of votes given as {(user_id, question_id): choice_id}.
+
+        The previous choices of the batch are read in one query and every new
+        or changed ballot is written with a single INSERT ... ON CONFLICT
+        DO UPDATE on the (user, question) constraint.  Counters and versions
+        are then adjusted with one UPDATE each, all in one transaction so the
+        stored tallies never drift from the Votes table.
+
+        The voters' rows are locked first, so concurrent ballots of one user
+        are applied one after the other and each reads the choice the other
+        wrote.  SQLite needs no lock: its write transactions begin IMMEDIATE
+        and already run one at a time.
+        """
+        if not ballots:
+            return 0
+        users = {user_id for user_id, _ in ballots}
+        questions = {question_id for _, question_id in ballots}
+        db = router.db_for_write(self.model)
+        with transaction.atomic(using=db):
+            if connections[db].features.has_select_for_update:
+                list(User.objects.using(db).select_for_update().filter(
+                    pk__in=users).order_by('pk').values_list('pk', flat=True))
+            previous = {
+                (user_id, question_id): choice_id
+                for user_id, question_id, choice_id in self.using(db).filter(
+                    user_id__in=users, question_id__in=questions
+                ).values_list('user_id', 'question_id', 'choice_id')
+            }
+            written, deltas = [], {}
+            for (user_id, question_id), choice_id in ballots.items():
+                old = previous.get((user_id, question_id))
+                if old == choice_id:
+                    continue
+                if old is not None:
+                    deltas[old] = deltas.get(old, 0) - 1
+                deltas[choice_id] = deltas.get(choice_id, 0) + 1
+                written.append(self.model(
+                    user_id=user_id, question_id=question_id,
+                    choice_id=choice_id))
+            if not written:
+                return 0
+            self.bulk_create(
+                written, update_conflicts=True,
+                unique_fields=['user', 'question'], update_fields=['choice'])
+            deltas = {pk: delta for pk, delta in deltas.items() if delta}
+            if deltas:
+                Choice.objects.filter(pk__in=deltas).update(
+                    vote_count=F('vote_count') + Case(*(
+                        When(pk=pk, then=delta)
+                        for pk, delta in deltas.items())))
+            Question.bump_vote_version(
+                *{vote.question_id for vote in written})
+        return len(written)
+
+
 class Votes(models.Model):
     """A vote by user for a question."""
 
-    user = models.ForeignKey(User, on_delete=models.CASCADE)
+    # Lookups by user are served by the (user, question) unique index.
+    user = models.ForeignKey(User, on_delete=models.CASCADE, db_index=False)
+    question = models.ForeignKey(Question, on_delete=models.CASCADE)
     choice = models.ForeignKey(Choice, on_delete=models.CASCADE)
 
-    @property
-    def question(self):
-        """Get the question from the selected choice."""
-        return self.choice.question
+    objects = VotesManager()
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['user', 'question'],
+                                    name='one_vote_per_question'),
+        ]
+
+    def save(self, *args, **kwargs):
+        """Copy the question from the choice before saving."""
+        if self.question_id is None and self.choice_id is not None:
+            self.question_id = self.choice.question_id
+        super().save(*args, **kwargs)
+
+
+class ResultSnapshot(models.Model):
+    """The final tally of a closed question, frozen when first read.
+
+    A snapshot only stands for the question while closed_at and vote_version
+    match the question's end_date and vote_version; reopening the question
+    or any later change to its votes or choices makes it be frozen again.
+    """
+
+    question = models.OneToOneField(
+        Question, on_delete=models.CASCADE, primary_key=True,
+        related_name='snapshot')
+    closed_at = models.DateTimeField()
+    vote_version = models.PositiveIntegerField()
+    total = models.PositiveIntegerField()
+    # [[choice id, choice text, votes], ...] in choice id order.
+    choices = models.JSONField()
+    frozen_at = models.DateTimeField(auto_now_add=True)
+
+    def matches(self, question):
+        """Return whether the snapshot still stands for the question."""
+        return (self.closed_at == question.end_date and
+                self.vote_version == question.vote_version)
@@ -0,0 +1,114 @@
+"""This module contains the whole-page cache of anonymous visitors.
+
+With PAGE_CACHE_ENABLED, views wrapped in page_cache() keep their rendered
+responses for visitors without a session or pending messages, so repeat
+views of the index and results pages are answered without a query.  Each
+page group has a generation token in the cache; votes and edits replace the
+token of the groups they change, which moves those pages to new keys.
+"""
+import asyncio
+import functools
+import hashlib
+import uuid
+
+from django.conf import settings
+from django.contrib.messages.storage.cookie import CookieStorage
+from django.core.cache import caches
+from django.utils.cache import patch_vary_headers
+
+
+def _generation_key(group, pk=None):
+    """Return the cache key of a page group's generation token."""
+    return f'page-generation:{group}:{pk or ""}'
+
+
+def expire_pages(group, pk=None):
+    """Drop the cached pages of a group, e.g. the results of one question."""
+    if settings.PAGE_CACHE_ENABLED:
+        caches[settings.PAGE_CACHE_ALIAS].set(
+            _generation_key(group, pk), uuid.uuid4().hex, None)
+
+
+def _page_key(cache, group, request, pk):
+    """Return the cache key of a page in its group's current generation."""
+    generation_key = _generation_key(group, pk)
+    generation = cache.get(generation_key)
+    if generation is None:
+        cache.add(generation_key, uuid.uuid4().hex, None)
+        generation = cache.get(generation_key)
+    url = hashlib.md5(
+        f'{request.get_host()}{request.get_full_path()}'.encode()).hexdigest()
+    return f'page:{group}:{generation}:{url}'
+
+
+def is_anonymous_visit(request):
+    """Return whether a request can share a cached page, from cookies only.
+
+    Without a session cookie the visitor cannot be logged in, and without a
+    messages cookie there is nothing queued to show them.
+    """
+    return (request.method in ('GET', 'HEAD') and
+            not request.COOKIES.get(settings.SESSION_COOKIE_NAME) and
+            not request.COOKIES.get(CookieStorage.cookie_name))
+
+
+def _store(cache, key, request, response):
+    """Cache a response once rendered, if it is the same for everyone.
+
+    Pages that set a cookie or embed a CSRF token are left out, since a
+    cached copy would hand one visitor's token to the next.
+    """
+    def store(response):
+        if (response.status_code == 200 and not response.cookies and
+                not request.META.get('CSRF_COOKIE_NEEDS_UPDATE')):
+            cache.set(key, response, settings.PAGE_CACHE_TTL)
+    if callable(getattr(response, 'add_post_render_callback', None)):
+        response.add_post_render_callback(store)
+    else:
+        store(response)
+
+
+def page_cache(group):
+    """Decorate a sync or async view to cache its pages for anonymous visits.
+
+    Pages are grouped per view and, for views taking a pk, per question.
+    """
+    def decorator(view):
+        def lookup(request, kwargs):
+            if not settings.PAGE_CACHE_ENABLED:
+                return None, None
+            if not is_anonymous_visit(request):
+                return None, None
+            cache = caches[settings.PAGE_CACHE_ALIAS]
+            key = _page_key(cache, group, request, kwargs.get('pk'))
+            return cache, key
+
+        def finish(response):
+            # Logged in visitors get different pages from the same URL.
+            patch_vary_headers(response, ['Cookie'])
+            return response
+
+        if asyncio.iscoroutinefunction(view):
+            @functools.wraps(view)
+            async def wrapper(request, *args, **kwargs):
+                cache, key = lookup(request, kwargs)
+                if cache is None:
+                    return await view(request, *args, **kwargs)
+                response = cache.get(key)
+                if response is None:
+                    response = await view(request, *args, **kwargs)
+                    _store(cache, key, request, response)
+                return finish(response)
+        else:
+            @functools.wraps(view)
+            def wrapper(request, *args, **kwargs):
+                cache, key = lookup(request, kwargs)
+                if cache is None:
+                    return view(request, *args, **kwargs)
+                response = cache.get(key)
+                if response is None:
+                    response = view(request, *args, **kwargs)
+                    _store(cache, key, request, response)
+                return finish(response)
+        return wrapper
+    return decorator
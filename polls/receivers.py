@@ -0,0 +1,84 @@
+"""This module contains the signal receivers of the polls application."""
+import threading
+
+from django.contrib.auth import get_user_model
+from django.contrib.auth.signals import user_logged_out
+from django.db import transaction
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+from .backends import forget_user
+from .events import broker
+from .models import Choice, Question, Votes
+from .pagecache import expire_pages
+from .signals import results_changed
+
+
+@receiver(post_save, sender=Question)
+@receiver(post_delete, sender=Question)
+def question_changed(sender, instance, **kwargs):
+    """Drop the cached pages of an edited question.
+
+    Its fragments follow edit_version, which Question.save() bumps itself.
+    """
+    expire_pages('index')
+    expire_pages('results', instance.pk)
+
+
+@receiver(post_save, sender=Choice)
+@receiver(post_delete, sender=Choice)
+def choice_changed(sender, instance, **kwargs):
+    """Invalidate the results and fragments of a question's choices."""
+    Question.bump_vote_version(instance.question_id)
+    Question.bump_edit_version(instance.question_id)
+
+
+_deletion = threading.local()
+
+
+@receiver(post_delete, sender=Votes)
+def vote_deleted(sender, instance, using, origin=None, **kwargs):
+    """Recount the choices of deleted votes, e.g. of a deleted user.
+
+    Every vote removed by one delete() call shares its origin, so the
+    choices they were for are collected and recounted together, in one
+    UPDATE, once the deletion commits.
+    """
+    if origin is None or getattr(_deletion, 'origin', None) is not origin:
+        choice_ids = set()
+        _deletion.origin, _deletion.choice_ids = origin, choice_ids
+
+        def recount():
+            _deletion.origin = None
+            Choice.objects.filter(pk__in=choice_ids).recount()
+        transaction.on_commit(recount, using=using)
+    _deletion.choice_ids.add(instance.choice_id)
+
+
+@receiver(results_changed)
+def publish_results(sender, question_ids, **kwargs):
+    """Wake the live results streams of the changed questions."""
+    events = broker()
+    for question_id in question_ids:
+        events.publish(question_id)
+
+
+@receiver(results_changed)
+def expire_results_pages(sender, question_ids, **kwargs):
+    """Drop the cached results pages of the changed questions."""
+    for question_id in question_ids:
+        expire_pages('results', question_id)
+
+
+@receiver(post_save, sender=get_user_model())
+@receiver(post_delete, sender=get_user_model())
+def user_changed(sender, instance, **kwargs):
+    """Drop a saved or deleted user from the user cache."""
+    forget_user(instance.pk)
+
+
+@receiver(user_logged_out)
+def forget_logged_out_user(sender, user, **kwargs):
+    """Drop a user who logged out from the user cache."""
+    if user is not None:
+        forget_user(user.pk)
@@ -0,0 +1,125 @@
+"""This module contains the tally pipeline behind the results page."""
+import time
+from dataclasses import dataclass
+
+from django.conf import settings
+from django.core.cache import caches
+from django.core.exceptions import ObjectDoesNotExist
+from django.db.models import Max, Sum, Window
+
+from .models import QuestionQuerySet, ResultSnapshot
+
+# Queries a results page may issue: the question lookup plus one tally query.
+RESULTS_QUERY_BUDGET = 2
+
+
+@dataclass(frozen=True)
+class ChoiceResult:
+    """The tally of one choice as shown on the results page."""
+
+    id: int
+    choice_text: str
+    votes: int
+    percentage: float
+    is_winner: bool
+
+
+def tally(question):
+    """Return a ChoiceResult for every choice of a question in one query.
+
+    The total and the leading count come from window aggregates over the
+    stored counters, so the cost does not grow with the number of choices.
+    """
+    rows = question.choice_set.annotate(
+        total=Window(Sum('vote_count')),
+        top=Window(Max('vote_count')),
+    ).order_by('pk').values_list(
+        'pk', 'choice_text', 'vote_count', 'total', 'top')
+    return _choice_results(rows)
+
+
+def _choice_results(rows):
+    """Return ChoiceResults from (id, text, votes, total, top) rows."""
+    return [
+        ChoiceResult(
+            id=pk,
+            choice_text=text,
+            votes=votes,
+            percentage=round(100 * votes / total, 1) if total else 0.0,
+            is_winner=bool(top) and votes == top,
+        )
+        for pk, text, votes, total, top in rows
+    ]
+
+
+def _results_cache():
+    """Return the cache that holds built tallies."""
+    return caches[settings.RESULTS_CACHE_ALIAS]
+
+
+def cached_tally(question):
+    """Return the tally of a question, rebuilding it at most once per vote.
+
+    Entries are stored per question together with the vote_version they were
+    built from.  When a vote has bumped the version, the first reader takes a
+    short lock and rebuilds while concurrent readers keep serving the previous
+    tally for up to RESULTS_CACHE_STALE_SECONDS.
+    """
+    cache = _results_cache()
+    key = f'polls:results:{question.pk}'
+    entry = cache.get(key)
+    if entry is not None:
+        version, built_at, results = entry
+        if version == question.vote_version:
+            return results
+        lock = f'{key}:rebuild:{question.vote_version}'
+        fresh_enough = time.time() - built_at <= (
+            settings.RESULTS_CACHE_STALE_SECONDS)
+        if fresh_enough and not cache.add(lock, True, timeout=10):
+            return results
+    results = tally(question)
+    cache.set(key, (question.vote_version, time.time(), results))
+    return results
+
+
+def freeze(question):
+    """Store the current tally of a closed question as its snapshot."""
+    results = tally(question)
+    snapshot = ResultSnapshot(
+        question=question, closed_at=question.end_date,
+        vote_version=question.vote_version,
+        total=sum(result.votes for result in results),
+        choices=[[result.id, result.choice_text, result.votes]
+                 for result in results])
+    ResultSnapshot.objects.bulk_create(
+        [snapshot], update_conflicts=True, unique_fields=['question'],
+        update_fields=['closed_at', 'vote_version', 'total', 'choices',
+                       'frozen_at'])
+    question.snapshot = snapshot
+    return snapshot
+
+
+def snapshot_results(snapshot):
+    """Return the ChoiceResults of a snapshot."""
+    top = max((votes for _, _, votes in snapshot.choices), default=0)
+    return _choice_results(
+        (pk, text, votes, snapshot.total, top)
+        for pk, text, votes in snapshot.choices)
+
+
+def results_for(question):
+    """Return the tally of a question, from its snapshot once it is closed.
+
+    Load the question with select_related('snapshot') so a closed poll's
+    results cost no query beyond the question itself; the snapshot is frozen
+    on the first read after the poll closes.
+    """
+    if question.get_status() != QuestionQuerySet.CLOSED:
+        return cached_tally(question)
+    try:
+        snapshot = question.snapshot
+    except ObjectDoesNotExist:
+        snapshot = None
+    if snapshot is None or not snapshot.matches(question):
+        snapshot = freeze(question)
+    return snapshot_results(snapshot)
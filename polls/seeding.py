@@ -0,0 +1,82 @@
+"""This module contains a bulk generator of synthetic polls data."""
+import datetime
+import random
+
+from django.contrib.auth.hashers import make_password
+from django.contrib.auth.models import User
+from django.utils import timezone
+
+from .models import Choice, Question, Votes
+
+
+def _chunks(rows, size):
+    """Yield lists of at most size items from an iterable."""
+    chunk = []
+    for row in rows:
+        chunk.append(row)
+        if len(chunk) == size:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
+
+
+def seed_polls(questions=100, choices=4, users=100, turnout=0.5, skew=1.0,
+               password=None, prefix='seed', seed=0, batch_size=1000):
+    """Bulk insert a synthetic dataset and return the new questions.
+
+    Every tenth question is closed and the one after it is still upcoming.
+    Each user votes on an open or closed question with probability turnout,
+    choosing among its choices with Zipf-like weights controlled by skew,
+    so a skew of 0 spreads votes evenly.  All users share one password.
+    """
+    rng = random.Random(seed)
+    now = timezone.now()
+    hashed = make_password(password)
+    User.objects.bulk_create(
+        (User(username=f'{prefix}_user_{i}', password=hashed)
+         for i in range(users)), batch_size=batch_size)
+    user_ids = list(User.objects.filter(
+        username__startswith=f'{prefix}_user_').values_list('pk', flat=True))
+
+    def make_question(i):
+        pub_date = now - datetime.timedelta(minutes=i + 1)
+        end_date = None
+        if i % 10 == 0:
+            end_date = now - datetime.timedelta(seconds=i + 1)
+        elif i % 10 == 1:
+            pub_date = now + datetime.timedelta(days=1)
+        return Question(question_text=f'{prefix} question {i}',
+                        pub_date=pub_date, end_date=end_date)
+
+    Question.objects.bulk_create(
+        (make_question(i) for i in range(questions)), batch_size=batch_size)
+    created = list(Question.objects.filter(
+        question_text__startswith=f'{prefix} question ').order_by('pk'))
+    Choice.objects.bulk_create(
+        (Choice(question=question, choice_text=f'choice {k}')
+         for question in created for k in range(choices)),
+        batch_size=batch_size)
+    choice_ids = {}
+    for pk, question_id in Choice.objects.filter(
+            question__in=created).order_by('pk').values_list(
+            'pk', 'question_id'):
+        choice_ids.setdefault(question_id, []).append(pk)
+
+    weights = [1 / (k + 1) ** skew for k in range(choices)]
+    votable = [question.pk for question in created
+               if question.pub_date <= now and choice_ids.get(question.pk)]
+
+    def ballots():
+        for user_id in user_ids:
+            for question_id in votable:
+                if rng.random() < turnout:
+                    choice_id = rng.choices(
+                        choice_ids[question_id], weights)[0]
+                    yield Votes(user_id=user_id, question_id=question_id,
+                                choice_id=choice_id)
+
+    for chunk in _chunks(ballots(), batch_size):
+        Votes.objects.bulk_create(chunk)
+    Choice.objects.filter(question__in=created).refresh_vote_counts()
+    return created
@@ -0,0 +1,6 @@
+"""This module contains the signals sent by the polls application."""
+from django.dispatch import Signal
+
+# Sent after a transaction that changed the tallies of some questions has
+# committed, with the ids of those questions as question_ids.
+results_changed = Signal()
@@ -1,12 +1,49 @@
 """This module contains a testcases for testing."""
+import asyncio
 import datetime
+import gzip
+import json
+import os
+import re
+import sqlite3
+import tempfile
+from io import StringIO
+from unittest import mock
 
-from django.test import TestCase, Client
+from asgiref.sync import async_to_sync, sync_to_async
+from django.conf import settings
+from django.core.cache import caches
+from django.core.management import call_command
+from django.db import IntegrityError, OperationalError, connection, connections
+from django.http import Http404, HttpResponse
+from django.test import (
+    Client, RequestFactory, SimpleTestCase, TestCase, TransactionTestCase,
+    override_settings)
+from django.test.utils import CaptureQueriesContext
 from django.utils import timezone
 from django.urls import reverse
+from django.contrib.auth.hashers import PBKDF2PasswordHasher, make_password
 from django.contrib.auth.models import User
 
-from .models import Question, Votes
+from mysite.backends.sqlite3.base import (
+    DatabaseWrapper as TunedSQLiteWrapper)
+from mysite.passwords import TunedPBKDF2PasswordHasher
+from mysite.staticfiles import serve_static
+from mysite.routers import (
+    PIN_COOKIE, PinPrimaryMiddleware, PrimaryReplicaRouter)
+
+from .admin import estimated_count
+from .backends import user_cache_key
+from .bench import percentile, summarize
+from .clock import request_now
+from .events import LocalBroker, tally_events
+from .ingest import VoteBuffer
+from .loaders import UserVoteLoader
+from .models import Choice, Question, ResultSnapshot, Votes
+from .views import IndexView
+from .results import (
+    RESULTS_QUERY_BUDGET, cached_tally, results_for, tally)
+from .throttle import LocalBucketStore, bucket_store, reset_bucket_store
 
 
 def create_question(question_text, days, end=None):
@@ -115,6 +152,10 @@ class VoteModelTests(TestCase):
 class QuestionIndexViewTests(TestCase):
     """Testcase for Index view."""
 
+    def setUp(self):
+        """Forget the fragments rendered for questions of earlier tests."""
+        caches['template_fragments'].clear()
+
     def test_no_questions(self):
         """If no questions exist, an appropriate message is displayed."""
         response = self.client.get(reverse('polls:index'))
@@ -166,6 +207,7 @@ class QuestionDetailViewTests(TestCase):
 
     def setUp(self):
         """Create a test user for testing."""
+        caches['template_fragments'].clear()
         self.test_user = User.objects.create_user("Python", "Test@gmail.com")
         self.test_user.set_password("Ilovecoding")
         self.test_user.save()
@@ -237,6 +279,7 @@ class QuestionVoteViewTests(TestCase):
     
     def setUp(self):
         """Create a test user for testing."""
+        caches['template_fragments'].clear()
         self.test_user = User.objects.create_user("Python", "Test@gmail.com")
         self.test_user.set_password("Ilovecoding")
         self.test_user.save()
@@ -260,4 +303,1413 @@ class QuestionVoteViewTests(TestCase):
         self.assertEqual(Votes.objects.all().count(), 1)
         test_selected = Votes.objects.get(user=self.user, choice__in = question.choice_set.all())
         self.assertEqual(test_selected.choice, choice3)
-        self.assertEqual(Votes.objects.all().count(), 1)
\ No newline at end of file
+        self.assertEqual(Votes.objects.all().count(), 1)
+
+
+class VoteCounterTests(TestCase):
+    """Testcase for the stored per-choice vote counters."""
+
+    def setUp(self):
+        """Create a user and a question with two choices."""
+        self.user = User.objects.create_user("Counter", password="Ilovecoding")
+        self.question = create_question(question_text="Counted", days=-1)
+        self.choice1 = self.question.choice_set.create(choice_text="one")
+        self.choice2 = self.question.choice_set.create(choice_text="two")
+        self.url = reverse('polls:vote', args=(self.question.id,))
+
+    def test_vote_increments_counter(self):
+        """A new vote adds one to the selected choice."""
+        self.client.login(username="Counter", password="Ilovecoding")
+        self.client.post(self.url, {'choice': self.choice1.id})
+        self.choice1.refresh_from_db()
+        self.assertEqual(self.choice1.votes, 1)
+
+    def test_changed_vote_moves_counter(self):
+        """Switching a vote moves the count from the old choice to the new."""
+        self.client.login(username="Counter", password="Ilovecoding")
+        self.client.post(self.url, {'choice': self.choice1.id})
+        self.client.post(self.url, {'choice': self.choice2.id})
+        self.choice1.refresh_from_db()
+        self.choice2.refresh_from_db()
+        self.assertEqual((self.choice1.votes, self.choice2.votes), (0, 1))
+        self.assertEqual(Votes.objects.count(), 1)
+
+    def test_anonymous_vote_redirects_to_login(self):
+        """An anonymous vote is not recorded."""
+        response = self.client.post(self.url, {'choice': self.choice1.id})
+        self.assertEqual(response.status_code, 302)
+        self.assertEqual(Votes.objects.count(), 0)
+
+    def test_one_vote_per_question_constraint(self):
+        """The database rejects a second vote row for the same question."""
+        Votes.objects.create(user=self.user, choice=self.choice1)
+        with self.assertRaises(IntegrityError):
+            Votes.objects.create(user=self.user, choice=self.choice2)
+
+    def test_changed_vote_is_one_upsert(self):
+        """Changing a vote writes the vote row with a single statement."""
+        Votes.objects.cast(self.user, self.choice1)
+        with self.assertNumQueries(6) as queries:
+            Votes.objects.cast(self.user, self.choice2)
+        upserts = [q['sql'] for q in queries.captured_queries
+                   if 'polls_votes' in q['sql'] and 'ON CONFLICT' in q['sql']]
+        self.assertEqual(len(upserts), 1)
+        self.assertEqual(Votes.objects.get().choice, self.choice2)
+
+    def test_cast_locks_voters_first(self):
+        """Where rows can be locked, the voter is locked before the read."""
+        features = connection.features
+        with mock.patch.object(features, 'has_select_for_update', True), \
+                mock.patch.object(connection.ops, 'for_update_sql',
+                                  return_value=''), \
+                CaptureQueriesContext(connection) as queries:
+            Votes.objects.cast(self.user, self.choice1)
+        tables = [re.search(r'FROM "(\w+)"', q['sql'])
+                  for q in queries.captured_queries]
+        tables = [table.group(1) for table in tables if table]
+        self.assertEqual(tables[:2], ['auth_user', 'polls_votes'])
+
+    def test_deleting_voter_takes_back_vote(self):
+        """Votes removed by a cascade are recounted once it commits."""
+        Votes.objects.cast(self.user, self.choice1)
+        version = Question.objects.get(pk=self.question.pk).vote_version
+        with self.captureOnCommitCallbacks(execute=True):
+            self.user.delete()
+        self.choice1.refresh_from_db()
+        self.assertEqual(self.choice1.votes, 0)
+        self.assertEqual(
+            Question.objects.get(pk=self.question.pk).vote_version,
+            version + 1)
+
+    def test_deleting_votes_recounts_each_choice_once(self):
+        """A bulk delete recounts in one UPDATE, even after drift."""
+        voters = [User.objects.create_user(f"Counter{i}") for i in range(3)]
+        for voter in voters:
+            Votes.objects.cast(voter, self.choice1)
+        Votes.objects.cast(self.user, self.choice2)
+        Choice.objects.filter(pk=self.choice1.pk).update(vote_count=0)
+        with CaptureQueriesContext(connection) as queries, \
+                self.captureOnCommitCallbacks(execute=True):
+            Votes.objects.all().delete()
+        recounts = [q['sql'] for q in queries.captured_queries
+                    if q['sql'].startswith('UPDATE "polls_choice"')]
+        self.assertEqual(len(recounts), 1)
+        self.assertEqual(
+            list(Choice.objects.order_by('pk').values_list(
+                'vote_count', flat=True)), [0, 0])
+
+    def test_saving_stale_choice_keeps_counter(self):
+        """Saving a choice loaded before a vote does not reset its count."""
+        stale = Choice.objects.get(pk=self.choice1.pk)
+        Votes.objects.cast(self.user, self.choice1)
+        stale.choice_text = "uno"
+        stale.save()
+        self.choice1.refresh_from_db()
+        self.assertEqual((self.choice1.choice_text, self.choice1.votes),
+                         ("uno", 1))
+
+    def test_saving_stale_question_keeps_vote_version(self):
+        """Saving a question loaded before a vote keeps the new version."""
+        stale = Question.objects.get(pk=self.question.pk)
+        Votes.objects.cast(self.user, self.choice1)
+        stale.question_text = "Recounted"
+        stale.save()
+        question = Question.objects.get(pk=self.question.pk)
+        self.assertEqual(question.question_text, "Recounted")
+        self.assertEqual(question.vote_version, stale.vote_version + 1)
+        self.assertIsNotNone(question.last_vote_at)
+
+    def test_reconcile_votes_command(self):
+        """The reconcile command rebuilds drifted counters from Votes."""
+        Votes.objects.create(user=self.user, choice=self.choice2)
+        Choice.objects.filter(pk=self.choice1.pk).update(vote_count=7)
+        out = StringIO()
+        call_command('reconcile_votes', stdout=out)
+        self.assertIn('Reconciled 2 of 2 choices.', out.getvalue())
+        self.choice1.refresh_from_db()
+        self.choice2.refresh_from_db()
+        self.assertEqual((self.choice1.votes, self.choice2.votes), (0, 1))
+
+
+class ResultsTallyTests(TestCase):
+    """Testcase for the aggregated results pipeline."""
+
+    def setUp(self):
+        """Create a question with three choices and some votes."""
+        caches['polls_results'].clear()
+        self.question = create_question(question_text="Tallied", days=-1)
+        for text, count in (("a", 3), ("b", 1), ("c", 0)):
+            self.question.choice_set.create(choice_text=text, vote_count=count)
+
+    def test_tally_percentages_and_winner(self):
+        """Each choice carries its count, share of the total and winner flag."""
+        results = tally(self.question)
+        self.assertEqual([r.votes for r in results], [3, 1, 0])
+        self.assertEqual([r.percentage for r in results], [75.0, 25.0, 0.0])
+        self.assertEqual([r.is_winner for r in results], [True, False, False])
+
+    def test_tally_without_votes_has_no_winner(self):
+        """A question without votes has no winner and no division by zero."""
+        Choice.objects.update(vote_count=0)
+        results = tally(self.question)
+        self.assertFalse(any(r.is_winner for r in results))
+        self.assertEqual({r.percentage for r in results}, {0.0})
+
+    def test_results_page_query_budget(self):
+        """The results page stays within budget however many choices exist."""
+        url = reverse('polls:results', args=(self.question.id,))
+        with self.assertNumQueries(RESULTS_QUERY_BUDGET):
+            self.client.get(url)
+        caches['polls_results'].clear()
+        for i in range(20):
+            self.question.choice_set.create(choice_text=f"extra {i}")
+        with self.assertNumQueries(RESULTS_QUERY_BUDGET):
+            response = self.client.get(url)
+        self.assertContains(
+            response, '<strong>a</strong> - <span class="votes">3</span> '
+                      '(<span class="percentage">75.0</span>%)')
+
+
+class ResultsCacheTests(TestCase):
+    """Testcase for the versioned results cache."""
+
+    def setUp(self):
+        """Create a voter and a question with two choices."""
+        caches['polls_results'].clear()
+        self.user = User.objects.create_user("Cached", password="Ilovecoding")
+        self.question = create_question(question_text="Cached", days=-1)
+        self.choice = self.question.choice_set.create(choice_text="yes")
+        self.question.choice_set.create(choice_text="no")
+        self.question.refresh_from_db()
+
+    def test_cache_hit_skips_tally_query(self):
+        """A second results request only looks the question up."""
+        url = reverse('polls:results', args=(self.question.id,))
+        self.client.get(url)
+        with self.assertNumQueries(1):
+            self.client.get(url)
+
+    def test_vote_invalidates_cached_tally(self):
+        """A vote bumps the version so the next read sees the new count."""
+        cached_tally(self.question)
+        Votes.objects.cast(self.user, self.choice)
+        self.question.refresh_from_db()
+        self.assertEqual(cached_tally(self.question)[0].votes, 1)
+
+    def test_stale_tally_served_during_rebuild(self):
+        """Readers keep the previous tally while another one rebuilds it."""
+        cached_tally(self.question)
+        Votes.objects.cast(self.user, self.choice)
+        self.question.refresh_from_db()
+        lock = (f'polls:results:{self.question.pk}:rebuild:'
+                f'{self.question.vote_version}')
+        caches['polls_results'].add(lock, True)
+        with self.assertNumQueries(0):
+            self.assertEqual(cached_tally(self.question)[0].votes, 0)
+
+
+class VoteBufferTests(TestCase):
+    """Testcase for buffered vote ingestion."""
+
+    def setUp(self):
+        """Create two voters and a question with two choices."""
+        self.users = [User.objects.create_user(f"Buffered{i}", password="pw")
+                      for i in range(2)]
+        self.question = create_question(question_text="Buffered", days=-1)
+        self.choice1 = self.question.choice_set.create(choice_text="one")
+        self.choice2 = self.question.choice_set.create(choice_text="two")
+        self.buffer = VoteBuffer(batch_size=10, flush_interval=None)
+
+    def test_flush_keeps_last_ballot_per_user(self):
+        """Only the latest ballot of each user and question is written."""
+        first, second = self.users
+        self.buffer.submit(first.pk, self.question.pk, self.choice1.pk)
+        self.buffer.submit(first.pk, self.question.pk, self.choice2.pk)
+        self.buffer.submit(second.pk, self.question.pk, self.choice2.pk)
+        self.assertEqual(self.buffer.flush(), 2)
+        self.assertEqual(len(self.buffer), 0)
+        self.choice2.refresh_from_db()
+        self.assertEqual(self.choice2.votes, 2)
+        self.assertEqual(Votes.objects.count(), 2)
+
+    def test_flush_updates_existing_vote(self):
+        """A buffered ballot replaces a vote that is already stored."""
+        Votes.objects.cast(self.users[0], self.choice1)
+        self.buffer.submit(self.users[0].pk, self.question.pk, self.choice2.pk)
+        with self.assertNumQueries(6):
+            self.buffer.flush()
+        self.assertEqual(Votes.objects.get().choice, self.choice2)
+        self.assertEqual(
+            list(Choice.objects.order_by('pk').values_list(
+                'vote_count', flat=True)), [0, 1])
+
+    def test_flush_drops_rejected_ballot(self):
+        """A ballot the database rejects does not hold back the others."""
+        first, second = self.users
+        cast_many = Votes.objects.cast_many
+
+        def reject_first_user(ballots):
+            if (first.pk, self.question.pk) in ballots:
+                raise IntegrityError('FOREIGN KEY constraint failed')
+            return cast_many(ballots)
+
+        self.buffer.submit(first.pk, self.question.pk, self.choice1.pk)
+        self.buffer.submit(second.pk, self.question.pk, self.choice2.pk)
+        with mock.patch.object(Votes.objects, 'cast_many',
+                               side_effect=reject_first_user), \
+                self.assertLogs('polls.ingest', 'WARNING'):
+            self.assertEqual(self.buffer.flush(), 1)
+        self.assertEqual(len(self.buffer), 0)
+        self.assertEqual(Votes.objects.get().user, second)
+
+    def test_flush_requeues_on_other_errors(self):
+        """Ballots are kept for the next flush if the database is down."""
+        self.buffer.submit(self.users[0].pk, self.question.pk, self.choice1.pk)
+        with mock.patch.object(Votes.objects, 'cast_many',
+                               side_effect=OperationalError('locked')):
+            with self.assertRaises(OperationalError):
+                self.buffer.flush()
+        self.assertEqual(len(self.buffer), 1)
+
+    @override_settings(VOTE_BUFFER_ENABLED=True)
+    def test_vote_view_submits_to_buffer(self):
+        """With buffering enabled the view queues the vote instead."""
+        self.client.login(username="Buffered0", password="pw")
+        with mock.patch('polls.views.vote_buffer', return_value=self.buffer):
+            self.client.post(reverse('polls:vote', args=(self.question.id,)),
+                             {'choice': self.choice1.id})
+        self.assertEqual(Votes.objects.count(), 0)
+        self.buffer.flush()
+        self.assertEqual(Votes.objects.get().choice, self.choice1)
+
+
+class QueryPlanTests(TestCase):
+    """Testcase for the indexes behind the hot lookups."""
+
+    def test_hot_queries_use_indexes(self):
+        """No hot lookup falls back to a full table scan."""
+        out = StringIO()
+        call_command('check_query_plans', questions=300, users=20,
+                     stdout=out)
+        self.assertIn('All hot queries use indexes.', out.getvalue())
+        self.assertFalse(Question.objects.exists())
+
+
+class IndexPaginationTests(TestCase):
+    """Testcase for the keyset-paginated index."""
+
+    def setUp(self):
+        """Create more published questions than fit on one page."""
+        caches['template_fragments'].clear()
+        self.questions = [
+            create_question(question_text=f"Page {i}", days=-i - 1)
+            for i in range(IndexView.page_size + 3)
+        ]
+
+    def test_first_page_has_next_cursor(self):
+        """The first page holds the newest questions and links onwards."""
+        response = self.client.get(reverse('polls:index'))
+        page = response.context['latest_question_list']
+        self.assertEqual(page, self.questions[:IndexView.page_size])
+        self.assertContains(response, "Older polls")
+
+    def test_cursor_continues_without_overlap(self):
+        """Following the cursor returns the remaining questions only."""
+        first = self.client.get(reverse('polls:index'))
+        response = self.client.get(reverse('polls:index'), {
+            'after': first.context['next_cursor']})
+        self.assertEqual(response.context['latest_question_list'],
+                         self.questions[IndexView.page_size:])
+        self.assertNotIn('next_cursor', response.context)
+
+    def test_page_is_one_query(self):
+        """A page costs one query however far into the list it is."""
+        first = self.client.get(reverse('polls:index'))
+        with self.assertNumQueries(1):
+            self.client.get(reverse('polls:index'), {
+                'after': first.context['next_cursor']})
+
+    def test_status_filters(self):
+        """The status filter selects open, closed or upcoming questions."""
+        closed = create_question(question_text="Closed", days=-1, end=-1)
+        upcoming = create_question(question_text="Upcoming", days=5)
+        url = reverse('polls:index')
+        for status, expected in (('closed', closed), ('upcoming', upcoming)):
+            response = self.client.get(url, {'status': status})
+            page = response.context['latest_question_list']
+            self.assertEqual(page, [expected])
+            self.assertEqual(page[0].status, status)
+        response = self.client.get(url, {'status': 'open'})
+        self.assertNotIn(closed, response.context['latest_question_list'])
+
+
+class UserVoteLoaderTests(TestCase):
+    """Testcase for the batched lookup of the user's own votes."""
+
+    def setUp(self):
+        """Create a voter and two questions whose choices share text."""
+        caches['template_fragments'].clear()
+        self.user = User.objects.create_user("Loader", password="Ilovecoding")
+        self.questions = [create_question(question_text=f"Loaded {i}", days=-1)
+                          for i in range(2)]
+        self.choices = [q.choice_set.create(choice_text="same")
+                        for q in self.questions]
+        self.twin = self.questions[0].choice_set.create(choice_text="same")
+        Votes.objects.cast(self.user, self.twin)
+
+    def test_load_maps_questions_to_choices_in_one_query(self):
+        """All questions are looked up at once and remembered."""
+        loader = UserVoteLoader(self.user)
+        ids = [q.pk for q in self.questions]
+        with self.assertNumQueries(1):
+            self.assertEqual(loader.load(ids), {ids[0]: self.twin.pk})
+            self.assertEqual(loader.load(ids[:1]), {ids[0]: self.twin.pk})
+
+    def test_detail_checks_voted_choice_by_id(self):
+        """Only the voted choice is checked even when texts are equal."""
+        self.client.login(username="Loader", password="Ilovecoding")
+        response = self.client.get(
+            reverse('polls:detail', args=(self.questions[0].id,)))
+        self.assertEqual(response.context['selected_choice_id'], self.twin.pk)
+        self.assertContains(response, "checked", count=1)
+
+    def test_index_marks_voted_questions(self):
+        """The index marks the questions the user has voted on."""
+        self.client.login(username="Loader", password="Ilovecoding")
+        response = self.client.get(reverse('polls:index'))
+        self.assertContains(response, "(voted)", count=1)
+
+
+class AsyncViewTests(TestCase):
+    """Testcase for the async detail, results and vote views."""
+
+    def setUp(self):
+        """Create a logged in voter and a question with two choices."""
+        caches['template_fragments'].clear()
+        caches['polls_results'].clear()
+        User.objects.create_user("Async", password="Ilovecoding")
+        self.client.login(username="Async", password="Ilovecoding")
+        self.question = create_question(question_text="Async?", days=-1)
+        self.choice = self.question.choice_set.create(choice_text="yes")
+        self.question.choice_set.create(choice_text="no")
+
+    def assertSameResponse(self, sync_name, async_name, *args):
+        """Assert that a sync and an async route answer identically."""
+        sync_url = reverse(f'polls:{sync_name}', args=args)
+        async_url = reverse(f'polls:{async_name}', args=args)
+        sync = self.client.get(sync_url)
+        asynchronous = self.client.get(async_url)
+        self.assertEqual(sync.status_code, asynchronous.status_code)
+        # The pages only differ in the logout link's ?next= path and in the
+        # per-render masking of the CSRF token.
+        token = re.compile(r'name="csrfmiddlewaretoken" value="[^"]*"')
+        self.assertEqual(
+            token.sub('', sync.content.decode()),
+            token.sub('', asynchronous.content.decode().replace(
+                async_url, sync_url)))
+
+    def test_detail_matches_sync_view(self):
+        """The async detail page is the same as the sync one."""
+        Votes.objects.cast(User.objects.get(), self.choice)
+        self.assertSameResponse('detail', 'async_detail', self.question.id)
+
+    def test_results_matches_sync_view(self):
+        """The async results page is the same as the sync one."""
+        self.assertSameResponse('results', 'async_results', self.question.id)
+
+    def test_async_detail_requires_login(self):
+        """An anonymous user is sent to the login page."""
+        self.client.logout()
+        response = self.client.get(
+            reverse('polls:async_detail', args=(self.question.id,)))
+        self.assertEqual(response.status_code, 302)
+        self.assertIn(reverse('login'), response.url)
+
+    def test_async_vote_records_vote(self):
+        """The async vote view casts the vote and redirects to results."""
+        response = self.client.post(
+            reverse('polls:async_vote', args=(self.question.id,)),
+            {'choice': self.choice.id})
+        self.assertRedirects(
+            response, reverse('polls:results', args=(self.question.id,)))
+        self.assertEqual(Votes.objects.get().choice, self.choice)
+
+
+class ResultsStreamTests(TestCase):
+    """Testcase for the live results stream."""
+
+    def setUp(self):
+        """Create a voter and a question with two choices."""
+        caches['polls_results'].clear()
+        self.user = User.objects.create_user("Streamed", password="pw")
+        self.question = create_question(question_text="Live", days=-1)
+        self.choice = self.question.choice_set.create(choice_text="yes")
+        self.question.choice_set.create(choice_text="no")
+
+    def test_broker_coalesces_changes(self):
+        """Several changes before a wait wake the subscriber once."""
+        events = LocalBroker()
+        seen = events.version(1)
+        events.publish(1)
+        events.publish(1)
+        seen = async_to_sync(events.wait)(1, seen, timeout=0)
+        self.assertEqual(seen, 2)
+        self.assertEqual(async_to_sync(events.wait)(1, seen, timeout=0), seen)
+
+    def test_broker_wakes_waiter_from_another_thread(self):
+        """A publish from a sync thread ends a pending async wait."""
+        events = LocalBroker()
+
+        async def wait_for_publish():
+            waiting = asyncio.create_task(events.wait(1, 0, timeout=5))
+            await asyncio.sleep(0)
+            await sync_to_async(events.publish, thread_sensitive=False)(1)
+            return await waiting
+
+        self.assertEqual(async_to_sync(wait_for_publish)(), 1)
+
+    def cast_vote(self):
+        """Vote for the first choice and publish the change."""
+        with self.captureOnCommitCallbacks(execute=True):
+            Votes.objects.cast(self.user, self.choice)
+
+    def close_question(self):
+        """End the question now."""
+        self.question.end_date = timezone.now()
+        self.question.save()
+
+    @override_settings(RESULTS_STREAM_INTERVAL=0, RESULTS_STREAM_HEARTBEAT=0)
+    def test_stream_sends_full_tally_then_deltas(self):
+        """The first event has every choice, later ones only the changes."""
+        # One event loop reads the whole stream: closing a loop also closes
+        # the async generators it started.
+        async def read_stream():
+            stream = tally_events(self.question.pk)
+            first = await stream.__anext__()
+            keep_alive = await stream.__anext__()
+            await sync_to_async(self.cast_vote)()
+            return first, keep_alive, await stream.__anext__()
+
+        first, keep_alive, delta = async_to_sync(read_stream)()
+        first = json.loads(first.split('data: ')[1])
+        self.assertEqual(len(first['choices']), 2)
+        self.assertEqual(keep_alive, ': keep-alive\n\n')
+        delta = json.loads(delta.split('data: ')[1])
+        self.assertEqual(delta['total'], 1)
+        self.assertEqual(delta['choices'][str(self.choice.pk)]['votes'], 1)
+
+    @override_settings(RESULTS_STREAM_INTERVAL=0, RESULTS_STREAM_HEARTBEAT=0)
+    def test_stream_ends_when_question_closes(self):
+        """The final tally of a closed question ends the stream."""
+        async def read_stream():
+            stream = tally_events(self.question.pk)
+            await stream.__anext__()
+            await sync_to_async(self.close_question)()
+            return [event async for event in stream]
+
+        self.assertEqual(async_to_sync(read_stream)(), [': keep-alive\n\n'])
+
+    @override_settings(RESULTS_STREAM_ENABLED=True)
+    def test_stream_response(self):
+        """The stream endpoint answers with an event stream."""
+        response = self.client.get(
+            reverse('polls:results_stream', args=(self.question.id,)))
+        self.assertEqual(response['Content-Type'], 'text/event-stream')
+
+        async def first_event():
+            return await response.streaming_content.__anext__()
+
+        self.assertTrue(async_to_sync(first_event)().startswith(
+            b'event: tally'))
+
+    @override_settings(RESULTS_STREAM_ENABLED=True)
+    def test_closed_question_has_no_stream(self):
+        """Closed questions answer 204 and their page opens no stream."""
+        closed = create_question(question_text="Over", days=-2, end=-1)
+        response = self.client.get(
+            reverse('polls:results_stream', args=(closed.id,)))
+        self.assertEqual(response.status_code, 204)
+        response = self.client.get(reverse('polls:results', args=(closed.id,)))
+        self.assertNotContains(response, 'EventSource')
+        response = self.client.get(
+            reverse('polls:results', args=(self.question.id,)))
+        self.assertContains(response, 'EventSource')
+
+    @override_settings(RESULTS_STREAM_ENABLED=False)
+    def test_stream_disabled(self):
+        """Without RESULTS_STREAM_ENABLED there is no stream to open."""
+        response = self.client.get(
+            reverse('polls:results_stream', args=(self.question.id,)))
+        self.assertEqual(response.status_code, 404)
+        response = self.client.get(
+            reverse('polls:results', args=(self.question.id,)))
+        self.assertNotContains(response, 'EventSource')
+
+
+class JsonApiTests(TestCase):
+    """Testcase for the JSON read API and its conditional GETs."""
+
+    def setUp(self):
+        """Create a voter and a question with two choices."""
+        caches['polls_results'].clear()
+        self.user = User.objects.create_user("Api", password="pw")
+        self.question = create_question(question_text="Json?", days=-1)
+        self.choice = self.question.choice_set.create(choice_text="yes")
+        self.question.choice_set.create(choice_text="no")
+        self.url = reverse('polls:api_results', args=(self.question.id,))
+
+    def test_question_list(self):
+        """The list holds published questions only."""
+        create_question(question_text="Later", days=3)
+        response = self.client.get(reverse('polls:api_questions'))
+        questions = response.json()['questions']
+        self.assertEqual([q['id'] for q in questions], [self.question.id])
+        self.assertEqual(questions[0]['status'], 'open')
+
+    def test_question_detail(self):
+        """The detail lists the choices of the question."""
+        response = self.client.get(
+            reverse('polls:api_question', args=(self.question.id,)))
+        self.assertEqual([c['choice_text'] for c in response.json()['choices']],
+                         ['yes', 'no'])
+
+    def test_results_carry_validators(self):
+        """Results have a strong ETag and a Last-Modified date."""
+        response = self.client.get(self.url)
+        self.assertEqual(response.json()['total'], 0)
+        self.assertTrue(response['ETag'].startswith('"'))
+        self.assertIn('Last-Modified', response)
+
+    def test_unchanged_results_are_not_modified(self):
+        """Revalidating unchanged results costs one query and no tally."""
+        etag = self.client.get(self.url)['ETag']
+        with self.assertNumQueries(1):
+            response = self.client.get(self.url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304)
+
+    def test_vote_changes_etag(self):
+        """A vote makes the previous ETag stale."""
+        etag = self.client.get(self.url)['ETag']
+        Votes.objects.cast(self.user, self.choice)
+        response = self.client.get(self.url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()['total'], 1)
+
+    def test_closing_changes_etag(self):
+        """Reaching the end date makes the previous ETag stale."""
+        etag = self.client.get(self.url)['ETag']
+        # Time passing changes no row, so no version is bumped.
+        Question.objects.filter(pk=self.question.pk).update(
+            end_date=timezone.now())
+        response = self.client.get(self.url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()['status'], 'closed')
+
+    def test_unpublished_question_is_not_found(self):
+        """Questions that are not published yet are hidden."""
+        later = create_question(question_text="Later", days=3)
+        response = self.client.get(
+            reverse('polls:api_results', args=(later.id,)))
+        self.assertEqual(response.status_code, 404)
+
+
+class VoteTransferTests(TestCase):
+    """Testcase for the import_votes and export_votes commands."""
+
+    def setUp(self):
+        """Create two voters and a question with two choices."""
+        self.users = [User.objects.create_user(f"Mover{i}", password="pw")
+                      for i in range(2)]
+        self.question = create_question(question_text="Moved", days=-1)
+        self.choice1 = self.question.choice_set.create(choice_text="one")
+        self.choice2 = self.question.choice_set.create(choice_text="two")
+        Votes.objects.cast(self.users[0], self.choice1)
+        Votes.objects.cast(self.users[1], self.choice2)
+
+    def export(self, fmt):
+        """Return the export of every vote in the given format."""
+        out = StringIO()
+        with mock.patch('sys.stdout', out):
+            call_command('export_votes', format=fmt, stderr=StringIO())
+        return out.getvalue()
+
+    def test_export_jsonl(self):
+        """Each vote is exported as one JSON line."""
+        lines = self.export('jsonl').splitlines()
+        self.assertEqual(json.loads(lines[0]), {
+            'user': 'Mover0', 'question': self.question.id,
+            'choice': self.choice1.id})
+        self.assertEqual(len(lines), 2)
+
+    def test_round_trip(self):
+        """Exported votes import back with the same counters."""
+        for fmt in ('jsonl', 'csv'):
+            exported = self.export(fmt)
+            Votes.objects.all().delete()
+            Choice.objects.update(vote_count=0)
+            err = StringIO()
+            with mock.patch('sys.stdin', StringIO(exported)):
+                call_command('import_votes', format=fmt, chunk_size=1,
+                             stderr=err)
+            self.assertIn('Imported 2 votes, skipped 0 of 2.', err.getvalue())
+            self.assertEqual(
+                list(Choice.objects.order_by('pk').values_list(
+                    'vote_count', flat=True)), [1, 1])
+
+    def test_import_skips_unknown_rows(self):
+        """Unknown users and mismatched choices are skipped."""
+        rows = [
+            {'user': 'Nobody', 'question': self.question.id,
+             'choice': self.choice1.id},
+            {'user': 'Mover0', 'question': self.question.id + 1,
+             'choice': self.choice1.id},
+            {'user': 'Mover0', 'question': self.question.id,
+             'choice': self.choice2.id},
+        ]
+        err = StringIO()
+        data = ''.join(json.dumps(row) + '\n' for row in rows)
+        with mock.patch('sys.stdin', StringIO(data)):
+            call_command('import_votes', stderr=err)
+        self.assertIn('Imported 1 votes, skipped 2 of 3.', err.getvalue())
+        self.assertEqual(
+            Votes.objects.get(user=self.users[0]).choice, self.choice2)
+
+
+class BenchmarkTests(TransactionTestCase):
+    """Testcase for the benchmark helpers and the bench_polls command."""
+
+    def test_percentile_nearest_rank(self):
+        """Percentiles use the nearest-rank method."""
+        samples = list(range(1, 101))
+        self.assertEqual(percentile(samples, 50), 50)
+        self.assertEqual(percentile(samples, 99), 99)
+        self.assertEqual(percentile([], 99), 0.0)
+
+    def test_summarize_reports_queries(self):
+        """The summary includes the mean number of queries when known."""
+        summary = summarize([0.1, 0.2], elapsed=1.0, queries=[3, 5])
+        self.assertEqual(summary['rps'], 2.0)
+        self.assertEqual(summary['queries_per_request'], 4.0)
+
+    def test_bench_polls_writes_baseline(self):
+        """A small run reports every target and cleans up its data."""
+        out = StringIO()
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, 'baseline.json')
+            call_command('bench_polls', questions=5, users=3, requests=4,
+                         concurrency=1, output=path, stdout=out)
+            with open(path) as baseline:
+                results = json.load(baseline)['results']
+        self.assertEqual(set(results),
+                         {'index', 'detail', 'results', 'vote', 'signup'})
+        self.assertEqual(results['signup']['errors'], 0)
+        self.assertEqual(results['results']['errors'], 0)
+        self.assertFalse(Question.objects.exists())
+
+
+METRICS_TEMPLATES = [{**settings.TEMPLATES[0],
+                      'BACKEND': 'mysite.metrics.TimedDjangoTemplates'}]
+
+
+@override_settings(
+    REQUEST_METRICS=True, TEMPLATES=METRICS_TEMPLATES,
+    MIDDLEWARE=['mysite.metrics.RequestMetricsMiddleware',
+                *settings.MIDDLEWARE])
+class RequestMetricsTests(TestCase):
+    """Testcase for the request metrics middleware."""
+
+    def setUp(self):
+        """Create a question and a staff user."""
+        caches['polls_results'].clear()
+        self.question = create_question(question_text="Timed", days=-1)
+        User.objects.create_user("Staff", password="pw", is_staff=True)
+
+    def test_server_timing_header(self):
+        """Responses report SQL, template and total time."""
+        response = self.client.get(
+            reverse('polls:results', args=(self.question.id,)))
+        timing = response['Server-Timing']
+        self.assertIn('desc="2 queries"', timing)
+        self.assertRegex(timing, r'tpl;dur=\d+\.\d+, total;dur=')
+
+    def test_metrics_endpoint_is_staff_only(self):
+        """Only staff users can read the aggregated histograms."""
+        self.client.get(reverse('polls:results', args=(self.question.id,)))
+        self.assertEqual(self.client.get(reverse('metrics')).status_code, 302)
+        self.client.login(username="Staff", password="pw")
+        views = self.client.get(reverse('metrics')).json()['views']
+        self.assertGreaterEqual(
+            views['polls:results']['sql_count']['count'], 1)
+        self.assertIn('buckets', views['polls:results']['total_ms'])
+
+    @override_settings(REQUEST_METRICS=False)
+    def test_metrics_endpoint_is_not_found_when_disabled(self):
+        """Without the metrics there is no page, even for staff users."""
+        self.assertEqual(self.client.get(reverse('metrics')).status_code, 404)
+        self.client.login(username="Staff", password="pw")
+        self.assertEqual(self.client.get(reverse('metrics')).status_code, 404)
+
+
+class SqliteProfileTests(TestCase):
+    """Testcase for the production SQLite backend profile."""
+
+    def open(self, path, **profile):
+        """Return a raw connection of the tuned backend to a database file."""
+        # Start from the backend defaults, not the active DB_PROFILE.
+        wrapper = TunedSQLiteWrapper({
+            **connection.settings_dict, 'NAME': path,
+            'OPTIONS': {'timeout': 0.1}, 'PRAGMAS': {},
+            'TRANSACTION_MODE': 'DEFERRED', **profile}, alias='profile')
+        wrapper.ensure_connection()
+        self.addCleanup(wrapper.close)
+        return wrapper.connection
+
+    def reader_blocked(self, **profile):
+        """Return whether a reader waits on an open write transaction."""
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, 'profile.sqlite3')
+            writer = self.open(path, **profile)
+            writer.execute('CREATE TABLE tally (votes INTEGER)')
+            writer.execute('BEGIN EXCLUSIVE')
+            writer.execute('INSERT INTO tally VALUES (1)')
+            try:
+                self.open(path, **profile).execute(
+                    'SELECT COUNT(*) FROM tally').fetchone()
+            except sqlite3.OperationalError:
+                return True
+            finally:
+                writer.execute('ROLLBACK')
+            return False
+
+    def test_rollback_journal_blocks_readers(self):
+        """Without the profile a reader fails while a vote is written."""
+        self.assertTrue(self.reader_blocked())
+
+    def test_wal_profile_does_not_block_readers(self):
+        """With WAL a reader sees the last commit while a vote is written."""
+        self.assertFalse(self.reader_blocked(
+            PRAGMAS={'journal_mode': 'WAL', 'synchronous': 'NORMAL'}))
+
+    def test_transaction_mode_is_applied(self):
+        """Transactions open with the configured BEGIN mode."""
+        wrapper = TunedSQLiteWrapper({
+            **connection.settings_dict, 'NAME': ':memory:',
+            'TRANSACTION_MODE': 'IMMEDIATE'}, alias='profile')
+        self.addCleanup(wrapper.close)
+        with mock.patch.object(wrapper, 'cursor') as cursor:
+            wrapper._start_transaction_under_autocommit()
+        cursor().execute.assert_called_with('BEGIN IMMEDIATE')
+
+
+@override_settings(DATABASE_REPLICAS=['replica0'], PIN_PRIMARY_SECONDS=10)
+class ReplicaRoutingTests(SimpleTestCase):
+    """Testcase for primary/replica routing and read-your-writes pinning."""
+
+    def setUp(self):
+        """Create a router and a middleware that reports the read database."""
+        self.router = PrimaryReplicaRouter()
+        self.factory = RequestFactory()
+        self.middleware = PinPrimaryMiddleware(
+            lambda request: HttpResponse(self.router.db_for_read(Question)))
+
+    def test_reads_go_to_replica_and_writes_to_primary(self):
+        """Outside a pinned request reads use a replica."""
+        self.assertEqual(self.router.db_for_read(Question), 'replica0')
+        self.assertEqual(self.router.db_for_write(Question), 'default')
+        self.assertTrue(self.router.allow_migrate('default', 'polls'))
+        self.assertFalse(self.router.allow_migrate('replica0', 'polls'))
+
+    def test_vote_is_pinned_and_sets_cookie(self):
+        """A POST reads from the primary and pins the client's next reads."""
+        response = self.middleware(self.factory.post('/polls/1/vote/'))
+        self.assertEqual(response.content, b'default')
+        self.assertEqual(response.cookies[PIN_COOKIE]['max-age'], 10)
+
+    def test_next_request_after_write_reads_primary(self):
+        """The pin cookie keeps the voter's next page on the primary."""
+        request = self.factory.get('/polls/1/results/')
+        request.COOKIES[PIN_COOKIE] = '1'
+        self.assertEqual(self.middleware(request).content, b'default')
+
+    def test_anonymous_reads_and_admin(self):
+        """Plain reads use replicas while admin pages use the primary."""
+        response = self.middleware(self.factory.get('/polls/'))
+        self.assertEqual(response.content, b'replica0')
+        self.assertNotIn(PIN_COOKIE, response.cookies)
+        response = self.middleware(self.factory.get('/admin/polls/'))
+        self.assertEqual(response.content, b'default')
+
+    def test_reads_in_a_transaction_use_primary(self):
+        """Reads that share a transaction with writes stay on the primary."""
+        with mock.patch.object(connections['default'], 'in_atomic_block',
+                               True):
+            self.assertEqual(self.router.db_for_read(Question), 'default')
+
+
+@override_settings(
+    DATABASE_REPLICAS=['replica0'], PIN_PRIMARY_SECONDS=10,
+    DATABASE_ROUTERS=['mysite.routers.PrimaryReplicaRouter'],
+    MIDDLEWARE=['mysite.routers.PinPrimaryMiddleware', *settings.MIDDLEWARE])
+class ReplicaViewTests(TransactionTestCase):
+    """Testcase for routing real views to a lagging replica."""
+
+    def setUp(self):
+        """Stand in for a replica with a copy of the primary's schema."""
+        caches['template_fragments'].clear()
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        connections.settings['replica0'] = {
+            **connections['default'].settings_dict,
+            'NAME': os.path.join(directory.name, 'replica.sqlite3')}
+        self.addCleanup(connections.settings.pop, 'replica0')
+        self.addCleanup(connections.__delitem__, 'replica0')
+        self.addCleanup(connections['replica0'].close)
+        connections['default'].ensure_connection()
+        connections['replica0'].ensure_connection()
+        connections['default'].connection.backup(
+            connections['replica0'].connection)
+        # The replica has not caught up with this question yet.
+        self.question = create_question(question_text="Fresh", days=-1)
+
+    def test_index_reads_replica_until_the_client_writes(self):
+        """Anonymous pages read the replica and pinned clients the primary."""
+        response = self.client.get(reverse('polls:index'))
+        self.assertNotContains(response, 'Fresh')
+        self.client.cookies[PIN_COOKIE] = '1'
+        response = self.client.get(reverse('polls:index'))
+        self.assertContains(response, 'Fresh')
+
+
+class LifecycleTests(TestCase):
+    """Testcase for poll status computed once per request."""
+
+    def setUp(self):
+        """Create an open, a closed and an upcoming question."""
+        self.open = create_question('Open', days=-1)
+        self.closed = create_question('Closed', days=-3, end=-1)
+        self.upcoming = create_question('Upcoming', days=2)
+
+    def test_annotated_status_does_not_read_the_clock(self):
+        """Lifecycle methods answer from the annotation of the queryset."""
+        questions = {q.pk: q for q in Question.objects.with_status()}
+        with mock.patch('polls.models.timezone.now') as now:
+            for question in questions.values():
+                question.was_published_recently()
+                question.is_published()
+                question.can_vote()
+        now.assert_not_called()
+        self.assertTrue(questions[self.open.pk].can_vote())
+        self.assertFalse(questions[self.closed.pk].can_vote())
+        self.assertFalse(questions[self.upcoming.pk].is_published())
+        self.assertEqual(questions[self.closed.pk].get_status(), 'closed')
+
+    def test_methods_accept_a_time(self):
+        """An explicit time overrides the clock and the annotation."""
+        later = timezone.now() + datetime.timedelta(days=3)
+        question = Question.objects.with_status().get(pk=self.upcoming.pk)
+        self.assertEqual(question.get_status(), 'upcoming')
+        self.assertEqual(question.get_status(later), 'open')
+        self.assertTrue(question.can_vote(later))
+
+    def test_request_now_is_read_once(self):
+        """Every call for the same request returns the same instant."""
+        request = RequestFactory().get('/polls/')
+        self.assertIs(request_now(request), request_now(request))
+
+    def test_admin_filters_and_sorts_by_status(self):
+        """The admin list filters and orders questions in the database."""
+        User.objects.create_superuser('admin', password='secret')
+        self.client.login(username='admin', password='secret')
+        url = reverse('admin:polls_question_changelist')
+        response = self.client.get(url, {'status': 'closed'})
+        self.assertEqual(
+            list(response.context['cl'].result_list), [self.closed])
+        response = self.client.get(url, {'o': '3'})
+        self.assertEqual(
+            [q.get_status() for q in response.context['cl'].result_list],
+            ['closed', 'open', 'upcoming'])
+
+
+class FragmentCacheTests(TestCase):
+    """Testcase for the cached choice fragments of the detail page."""
+
+    detail_route = 'polls:detail'
+
+    def setUp(self):
+        """Create a logged in voter and a question with two choices."""
+        caches['template_fragments'].clear()
+        User.objects.create_user("Fragment", password="Ilovecoding")
+        self.client.login(username="Fragment", password="Ilovecoding")
+        self.question = create_question("Cached?", days=-1)
+        self.choices = [self.question.choice_set.create(choice_text=text)
+                        for text in ('Yes', 'No')]
+        self.url = reverse(self.detail_route, args=(self.question.id,))
+
+    def test_choices_are_rendered_once(self):
+        """A second detail page reuses the choices without querying them."""
+        self.client.get(self.url)
+        with self.assertNumQueries(4):
+            response = self.client.get(self.url)
+        self.assertContains(response, 'Yes')
+        self.assertNotContains(response, 'checked')
+
+    def test_selected_choice_is_not_shared(self):
+        """The voter's own choice is marked outside the shared fragment."""
+        self.client.get(self.url)
+        Votes.objects.cast(User.objects.get(username="Fragment"),
+                           self.choices[1])
+        # The cached fragment is reused, so the choices are not queried.
+        with self.assertNumQueries(4):
+            response = self.client.get(self.url)
+        self.assertContains(
+            response, f'input[name="choice"][value="{self.choices[1].id}"]')
+        self.assertNotContains(response, 'checked>')
+
+    def test_admin_edits_invalidate_fragments(self):
+        """Saving a question or a choice renders its fragments again."""
+        self.client.get(self.url)
+        self.client.get(reverse('polls:index'))
+        choice = self.choices[0]
+        choice.choice_text = 'Definitely'
+        choice.save()
+        self.assertContains(self.client.get(self.url), 'Definitely')
+        self.question.question_text = 'Renamed?'
+        self.question.save()
+        self.assertContains(self.client.get(reverse('polls:index')),
+                            'Renamed?')
+
+    def test_stale_question_save_does_not_reuse_fragments(self):
+        """Saving an instance loaded before an edit still moves the key."""
+        stale = Question.objects.get(pk=self.question.pk)
+        version = stale.edit_version
+        self.client.get(self.url)
+        self.question.choice_set.create(choice_text='Maybe')
+        stale.save()
+        self.assertEqual(stale.edit_version, version + 2)
+        self.assertContains(self.client.get(self.url), 'Maybe')
+
+
+class AsyncFragmentCacheTests(FragmentCacheTests):
+    """Testcase for the cached choice fragments of the async detail page."""
+
+    detail_route = 'polls:async_detail'
+
+
+class AdminChangelistTests(TestCase):
+    """Testcase for the question, choice and votes admin lists."""
+
+    def setUp(self):
+        """Create an admin and a question voted on by three users."""
+        User.objects.create_superuser('admin', password='secret')
+        self.client.login(username='admin', password='secret')
+        self.question = create_question('Admin?', days=-1)
+        self.yes = self.question.choice_set.create(choice_text='Yes')
+        self.no = self.question.choice_set.create(choice_text='No')
+        for i in range(3):
+            Votes.objects.cast(User.objects.create_user(f'voter{i}'),
+                               self.yes)
+
+    def changelist(self, model, **params):
+        """Return the changelist of a polls model."""
+        url = reverse(f'admin:polls_{model}_changelist')
+        return self.client.get(url, params).context['cl']
+
+    def test_question_list_shows_vote_totals(self):
+        """Each question is annotated with its number of votes."""
+        question = self.changelist('question').result_list[0]
+        self.assertEqual(question.total_votes, 3)
+
+    def test_votes_list_query_count_is_constant(self):
+        """Users, questions and choices are joined, not fetched per row."""
+        self.changelist('votes')
+        with self.assertNumQueries(5):
+            self.changelist('votes')
+        Votes.objects.cast(User.objects.create_user('voter3'), self.no)
+        with self.assertNumQueries(5):
+            self.changelist('votes')
+
+    @override_settings(ADMIN_COUNT_ESTIMATE_THRESHOLD=1)
+    def test_large_tables_use_estimated_count(self):
+        """Unfiltered lists read the table estimate instead of counting."""
+        Votes.objects.filter(choice=self.yes).first().delete()
+        with connection.cursor() as cursor:
+            cursor.execute('ANALYZE')
+        Votes.objects.filter(choice=self.yes).first().delete()
+        self.assertEqual(estimated_count(Votes.objects.all()), 2)
+        self.assertEqual(self.changelist('votes').result_count, 2)
+        self.assertEqual(
+            self.changelist('votes', q='voter').result_count, 1)
+
+    def test_admin_vote_edits_keep_counters(self):
+        """Adding, moving and deleting votes in the admin recounts choices."""
+        voter = User.objects.create_user('admin-voter')
+        self.client.post(reverse('admin:polls_votes_add'),
+                         {'user': voter.pk, 'choice': self.no.pk})
+        vote = Votes.objects.get(user=voter)
+        self.assertEqual(Choice.objects.get(pk=self.no.pk).vote_count, 1)
+        self.client.post(reverse('admin:polls_votes_change', args=(vote.pk,)),
+                         {'user': voter.pk, 'choice': self.yes.pk})
+        self.assertEqual(Choice.objects.get(pk=self.yes.pk).vote_count, 4)
+        self.assertEqual(Choice.objects.get(pk=self.no.pk).vote_count, 0)
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.post(
+                reverse('admin:polls_votes_delete', args=(vote.pk,)),
+                {'post': 'yes'})
+        self.assertEqual(Choice.objects.get(pk=self.yes.pk).vote_count, 3)
+
+    def test_admin_rejects_second_vote_on_question(self):
+        """A duplicate vote is a form error, not a database error."""
+        voter = User.objects.get(username='voter0')
+        response = self.client.post(reverse('admin:polls_votes_add'),
+                                    {'user': voter.pk, 'choice': self.no.pk})
+        self.assertEqual(response.status_code, 200)
+        self.assertContains(
+            response, 'This user has already voted on this question.')
+        self.assertEqual(Votes.objects.filter(user=voter).get().choice,
+                         self.yes)
+
+
+@override_settings(THROTTLE_RATES={'vote': '2/m', 'signup': '1/h'},
+                   THROTTLE_IP_RATES={'vote': '4/m', 'signup': '1/h'})
+class ThrottleTests(TestCase):
+    """Testcase for the token bucket throttle of voting and signing up."""
+
+    def setUp(self):
+        """Create a logged in voter and a question with a choice."""
+        reset_bucket_store('THROTTLE_RATES')
+        User.objects.create_user("Throttled", password="Ilovecoding")
+        self.client.login(username="Throttled", password="Ilovecoding")
+        question = create_question("Throttled?", days=-1)
+        self.choice = question.choice_set.create(choice_text='Yes')
+        self.url = reverse('polls:vote', args=(question.id,))
+
+    def vote(self, client=None, **extra):
+        """Post a vote and return the response status."""
+        client = client or self.client
+        return client.post(self.url, {'choice': self.choice.id},
+                           **extra).status_code
+
+    def test_rejected_votes_only_read_the_session(self):
+        """Votes over the rate get 429 and Retry-After, loading no user."""
+        for _ in range(2):
+            self.assertEqual(self.vote(), 302)
+        with self.assertNumQueries(1):
+            response = self.client.post(self.url, {'choice': self.choice.id})
+        self.assertEqual(response.status_code, 429)
+        self.assertEqual(response['Retry-After'], '30')
+
+    def test_async_vote_is_throttled(self):
+        """The async vote view shares the buckets of the sync one."""
+        url = reverse('polls:async_vote', args=(self.choice.question_id,))
+        statuses = [self.client.post(url, {'choice': self.choice.id})
+                    .status_code for _ in range(3)]
+        self.assertEqual(statuses, [302, 302, 429])
+
+    def test_dropping_the_session_cookie_keeps_the_bucket(self):
+        """The user's bucket follows the login, not the session cookie."""
+        for _ in range(2):
+            self.vote()
+        other = Client()
+        other.login(username="Throttled", password="Ilovecoding")
+        self.assertEqual(self.vote(other), 429)
+
+    def test_users_behind_one_address_share_a_larger_bucket(self):
+        """Each user has their own rate until the address's rate is used."""
+        User.objects.create_user("Neighbour", password="Ilovecoding")
+        neighbour = Client()
+        neighbour.login(username="Neighbour", password="Ilovecoding")
+        statuses = [self.vote(), self.vote(), self.vote(neighbour),
+                    self.vote(neighbour), self.vote(neighbour)]
+        self.assertEqual(statuses, [302, 302, 302, 302, 429])
+
+    @override_settings(THROTTLE_PROXY_COUNT=1)
+    def test_address_is_read_behind_a_proxy(self):
+        """Behind a proxy, clients are told apart by X-Forwarded-For."""
+        anonymous = Client(REMOTE_ADDR='10.0.0.1')
+        for _ in range(4):
+            anonymous.post(self.url, HTTP_X_FORWARDED_FOR='1.1.1.1')
+        self.assertEqual(anonymous.post(
+            self.url, HTTP_X_FORWARDED_FOR='1.1.1.1').status_code, 429)
+        self.assertNotEqual(anonymous.post(
+            self.url, HTTP_X_FORWARDED_FOR='9.9.9.9, 2.2.2.2').status_code,
+            429)
+
+    def test_signup_is_throttled_but_the_form_is_not(self):
+        """Only submitted signups use up the bucket."""
+        client = Client()
+        client.post(reverse('signup'), {'username': 'new'})
+        self.assertEqual(client.get(reverse('signup')).status_code, 200)
+        response = client.post(reverse('signup'), {'username': 'new'})
+        self.assertEqual(response.status_code, 429)
+        self.assertEqual(response['Retry-After'], '3600')
+
+    @override_settings(THROTTLE_MAX_ENTRIES=2)
+    def test_local_store_is_bounded(self):
+        """The least recently used buckets are forgotten first."""
+        store = bucket_store()
+        self.assertIsInstance(store, LocalBucketStore)
+        for key in ('a', 'b', 'a', 'c'):
+            store.take(key, 1, 1)
+        self.assertEqual(list(store._buckets), ['a', 'c'])
+
+
+class SessionProfileTests(TestCase):
+    """Testcase for cached sessions and the cached user backend."""
+
+    def setUp(self):
+        """Create a voter and a question with a choice."""
+        caches['default'].clear()
+        caches['template_fragments'].clear()
+        self.user = User.objects.create_user("Cached", password="Ilovecoding")
+        question = create_question("Cached user?", days=-1)
+        question.choice_set.create(choice_text='Yes')
+        self.url = reverse('polls:detail', args=(question.id,))
+
+    def detail_queries(self):
+        """Return the number of queries of a warm detail page."""
+        client = Client()
+        client.login(username="Cached", password="Ilovecoding")
+        client.get(self.url)
+        with CaptureQueriesContext(connection) as queries:
+            self.assertEqual(client.get(self.url).status_code, 200)
+        return len(queries)
+
+    def test_cached_sessions_and_users_save_two_queries(self):
+        """The session and user rows are not read on a warm request."""
+        default = self.detail_queries()
+        with self.settings(
+                SESSION_ENGINE='django.contrib.sessions.backends.cached_db',
+                AUTHENTICATION_BACKENDS=['polls.backends.CachedModelBackend'],
+                USER_CACHE_TTL=60):
+            self.assertEqual(self.detail_queries(), default - 2)
+
+    @override_settings(
+        AUTHENTICATION_BACKENDS=['polls.backends.CachedModelBackend'],
+        USER_CACHE_TTL=60)
+    def test_password_change_and_logout_drop_the_cached_user(self):
+        """Other sessions end on a password change; logout forgets the user."""
+        self.client.login(username="Cached", password="Ilovecoding")
+        self.client.get(self.url)
+        key = user_cache_key(self.user.pk)
+        self.assertIsNotNone(caches['default'].get(key))
+        self.user.set_password("Newpassword")
+        self.user.save()
+        self.assertEqual(self.client.get(self.url).status_code, 302)
+        self.client.login(username="Cached", password="Newpassword")
+        self.client.get(self.url)
+        self.client.post(reverse('logout'))
+        self.assertIsNone(caches['default'].get(key))
+
+
+class SignupTests(TestCase):
+    """Testcase for signing up with the configured password hashing."""
+
+    def signup(self, password2='Signup-secret-42'):
+        """Post the signup form and return the response."""
+        return self.client.post(reverse('signup'), {
+            'username': 'newcomer', 'password1': 'Signup-secret-42',
+            'password2': password2})
+
+    def test_signup_hashes_once_and_logs_in(self):
+        """The new user is logged in without hashing the password again."""
+        with mock.patch('mysite.passwords.make_password',
+                        wraps=make_password) as hasher:
+            response = self.signup()
+        self.assertRedirects(response, reverse('polls:index'))
+        hasher.assert_called_once_with('Signup-secret-42')
+        user = User.objects.get(username='newcomer')
+        self.assertTrue(user.password.startswith(
+            f'pbkdf2_sha256${PBKDF2PasswordHasher.iterations}$'))
+        self.assertTrue(user.check_password('Signup-secret-42'))
+        self.assertEqual(self.client.get(reverse('polls:index'))
+                         .context['user'], user)
+
+    def test_invalid_signup_shows_the_errors(self):
+        """A form with mismatched passwords is shown again."""
+        response = self.signup(password2='something-else')
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response.context['form'].errors)
+        self.assertFalse(User.objects.filter(username='newcomer').exists())
+
+    def test_iterations_cannot_go_below_the_default(self):
+        """PASSWORD_ITERATIONS only ever raises the PBKDF2 cost."""
+        default = PBKDF2PasswordHasher.iterations
+        for setting, expected in [(0, default), (1000, default),
+                                  (default + 1, default + 1)]:
+            with self.subTest(setting=setting), \
+                    override_settings(PASSWORD_ITERATIONS=setting):
+                self.assertEqual(TunedPBKDF2PasswordHasher().iterations,
+                                 expected)
+
+
+class StaticPipelineTests(TestCase):
+    """Testcase for the hashed, compressed static files pipeline."""
+
+    def setUp(self):
+        """Collect the static files with the production storage."""
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        backend = 'mysite.staticfiles.CompressedManifestStaticFilesStorage'
+        storages = {**settings.STORAGES,
+                    'staticfiles': {'BACKEND': backend}}
+        settings_override = override_settings(
+            STATIC_ROOT=directory.name, STORAGES=storages)
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+        call_command('collectstatic', interactive=False, verbosity=0)
+        self.factory = RequestFactory()
+
+    def stylesheet(self):
+        """Return the static path the index page links its stylesheet to."""
+        page = self.client.get(reverse('polls:index')).content.decode()
+        href = re.search(r'href="/static/(polls/style\.[^"]+)"', page)
+        return href.group(1)
+
+    def test_pages_link_hashed_assets(self):
+        """Templates link the content-hashed name of the stylesheet."""
+        self.assertRegex(self.stylesheet(),
+                         r'^polls/style\.[0-9a-f]{12}\.css$')
+
+    def test_hashed_assets_are_immutable_and_compressed(self):
+        """Hashed files are served gzipped with far-future headers."""
+        path = self.stylesheet()
+        request = self.factory.get('/static/' + path,
+                                   HTTP_ACCEPT_ENCODING='gzip, deflate')
+        response = serve_static(request, path)
+        self.assertEqual(response['Content-Type'], 'text/css')
+        self.assertEqual(response['Content-Encoding'], 'gzip')
+        self.assertIn('immutable', response['Cache-Control'])
+        self.assertEqual(response['Vary'], 'Accept-Encoding')
+        css = gzip.decompress(b''.join(response.streaming_content))
+        self.assertIn(b'Background.', css)
+
+    def test_plain_requests_and_unhashed_names(self):
+        """Clients without gzip get the file; unhashed names expire soon."""
+        request = self.factory.get('/static/polls/style.css')
+        response = serve_static(request, 'polls/style.css')
+        self.assertNotIn('Content-Encoding', response)
+        self.assertEqual(response['Cache-Control'], 'public, max-age=60')
+        with self.assertRaises(Http404):
+            serve_static(request, '../settings.py')
+
+
+@override_settings(PAGE_CACHE_ENABLED=True)
+class PageCacheTests(TestCase):
+    """Testcase for the whole-page cache of anonymous visitors."""
+
+    def setUp(self):
+        """Create a question with a choice and forget cached pages."""
+        caches['polls_pages'].clear()
+        caches['polls_results'].clear()
+        caches['template_fragments'].clear()
+        self.question = create_question("Cached page?", days=-1)
+        self.choice = self.question.choice_set.create(choice_text='Yes')
+        self.results_url = reverse('polls:results', args=(self.question.id,))
+
+    def test_repeat_visits_do_not_query(self):
+        """A cached page is served without touching the database."""
+        first = self.client.get(reverse('polls:index'))
+        with self.assertNumQueries(0):
+            response = self.client.get(reverse('polls:index'))
+        self.assertEqual(response.content, first.content)
+        self.assertIn('Cookie', response['Vary'])
+        self.client.get(self.results_url)
+        with self.assertNumQueries(0):
+            self.client.get(self.results_url)
+
+    def test_votes_and_edits_expire_pages(self):
+        """New votes change results pages; edits change the index."""
+        self.client.get(self.results_url)
+        self.client.get(reverse('polls:index'))
+        voter = User.objects.create_user("Page", password="Ilovecoding")
+        with self.captureOnCommitCallbacks(execute=True):
+            Votes.objects.cast(voter, self.choice)
+        response = self.client.get(self.results_url)
+        self.assertContains(response, '<span class="votes">1</span>')
+        self.question.question_text = 'Renamed page?'
+        self.question.save()
+        self.assertContains(self.client.get(reverse('polls:index')),
+                            'Renamed page?')
+
+    def test_logged_in_visitors_are_not_served_cached_pages(self):
+        """A session cookie bypasses the cache."""
+        self.client.get(reverse('polls:index'))
+        User.objects.create_user("Page", password="Ilovecoding")
+        self.client.login(username="Page", password="Ilovecoding")
+        response = self.client.get(reverse('polls:index'))
+        self.assertContains(response, 'Welcome! Page')
+
+    def test_messages_still_appear(self):
+        """A visitor with a pending message gets a freshly rendered page."""
+        upcoming = create_question("Not yet", days=5)
+        self.client.get(reverse('polls:index'))
+        response = self.client.get(
+            reverse('polls:results', args=(upcoming.id,)), follow=True)
+        self.assertContains(response, 'This question is not available.')
+        with self.assertNumQueries(0):
+            response = self.client.get(reverse('polls:index'))
+        self.assertNotContains(response, 'This question is not available.')
+
+
+class ResultSnapshotTests(TestCase):
+    """Testcase for the frozen results of closed polls."""
+
+    def setUp(self):
+        """Create a closed question with votes for two choices."""
+        caches['polls_results'].clear()
+        self.question = create_question("Closed poll?", days=-5, end=-1)
+        self.yes = self.question.choice_set.create(choice_text='Yes')
+        self.no = self.question.choice_set.create(choice_text='No')
+        for i, choice in enumerate([self.yes, self.yes, self.no]):
+            Votes.objects.create(
+                user=User.objects.create_user(f"closed{i}"), choice=choice)
+        Choice.objects.all().refresh_vote_counts()
+        self.url = reverse('polls:results', args=(self.question.id,))
+
+    def test_first_read_freezes_the_results(self):
+        """Closed results are frozen once, then read with the question."""
+        expected = tally(self.question)
+        self.client.get(self.url)
+        snapshot = ResultSnapshot.objects.get(question=self.question)
+        self.assertEqual(snapshot.total, 3)
+        self.assertEqual(snapshot.closed_at, self.question.end_date)
+        with self.assertNumQueries(1):
+            response = self.client.get(self.url)
+        self.assertEqual(response.context['results'], expected)
+
+    def test_changed_or_reopened_polls_are_frozen_again(self):
+        """A later vote change refreezes; a reopened poll is tallied live."""
+        self.client.get(self.url)
+        Votes.objects.filter(choice=self.no).update(choice=self.yes)
+        Choice.objects.all().refresh_vote_counts()
+        Question.bump_vote_version(self.question.pk)
+        question = Question.objects.with_status().get(pk=self.question.pk)
+        self.assertEqual(results_for(question)[0].votes, 3)
+        self.assertEqual(ResultSnapshot.objects.get().choices[1][2], 0)
+        question.end_date = timezone.now() + datetime.timedelta(days=1)
+        question.save()
+        question = Question.objects.with_status().get(pk=self.question.pk)
+        with mock.patch('polls.results.freeze') as freeze:
+            results_for(question)
+        freeze.assert_not_called()
+
+    def test_votes_on_closed_polls_are_rejected(self):
+        """The vote view no longer accepts ballots after end_date."""
+        User.objects.create_user("Late", password="Ilovecoding")
+        self.client.login(username="Late", password="Ilovecoding")
+        response = self.client.post(
+            reverse('polls:vote', args=(self.question.id,)),
+            {'choice': self.no.id})
+        self.assertRedirects(response, reverse('polls:index'))
+        self.assertFalse(Votes.objects.filter(user__username="Late").exists())
+
+    def test_command_freezes_closed_polls(self):
+        """freeze_results snapshots closed polls once and skips open ones."""
+        create_question("Open poll?", days=-1)
+        out = StringIO()
+        call_command('freeze_results', stdout=out)
+        call_command('freeze_results', stdout=out)
+        self.assertEqual(out.getvalue().splitlines(), [
+            'Froze 1 of 1 closed questions.',
+            'Froze 0 of 1 closed questions.'])
+        self.assertEqual(ResultSnapshot.objects.get().question, self.question)
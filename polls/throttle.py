@@ -0,0 +1,184 @@
+"""This module contains the token bucket throttle of the write views.
+
+Each throttled view has a rate per logged in user in THROTTLE_RATES and a
+higher one per IP address in THROTTLE_IP_RATES, written as "count/period",
+where period is s, m, h or d.  A client may make up to count requests at once
+and then one more every period / count seconds.  The user is read from the
+session, never from the user table, and behind THROTTLE_PROXY_COUNT reverse
+proxies the address is taken from X-Forwarded-For, so a rejected request is
+answered before any user or question is loaded.
+"""
+import asyncio
+import functools
+import math
+import threading
+import time
+from collections import OrderedDict
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.contrib.auth import SESSION_KEY
+from django.core.cache import caches
+from django.core.signals import setting_changed
+from django.dispatch import receiver
+from django.http import HttpResponse
+
+PERIODS = {'s': 1, 'm': 60, 'h': 3600, 'd': 86400}
+
+
+def parse_rate(rate):
+    """Return the (capacity, tokens per second) of a "count/period" rate."""
+    count, _, period = rate.partition('/')
+    count = int(count)
+    return count, count / PERIODS[period[:1]]
+
+
+def refill(bucket, capacity, per_second, now):
+    """Return the bucket after taking one token, and the seconds to wait.
+
+    A bucket is a (tokens, updated_at) pair; None is a full bucket.
+    """
+    tokens, updated_at = bucket or (capacity, now)
+    tokens = min(capacity, tokens + (now - updated_at) * per_second)
+    if tokens >= 1:
+        return (tokens - 1, now), 0
+    return (tokens, now), (1 - tokens) / per_second
+
+
+class LocalBucketStore:
+    """Keep token buckets in this process, forgetting the least recent."""
+
+    def __init__(self, max_entries):
+        """Create an empty store holding at most max_entries buckets."""
+        self.max_entries = max_entries
+        self._buckets = OrderedDict()
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        """Return the number of buckets kept."""
+        return len(self._buckets)
+
+    def take(self, key, capacity, per_second):
+        """Take a token from a bucket and return the seconds to wait."""
+        now = time.monotonic()
+        with self._lock:
+            bucket, wait = refill(
+                self._buckets.pop(key, None), capacity, per_second, now)
+            self._buckets[key] = bucket
+            if len(self._buckets) > self.max_entries:
+                self._buckets.popitem(last=False)
+        return wait
+
+
+class CacheBucketStore:
+    """Keep token buckets in a shared cache, so every process agrees.
+
+    The read and write of a bucket are not atomic; under a race a client
+    may get an extra request through, which is acceptable for throttling.
+    """
+
+    def __init__(self, alias):
+        """Use the cache with the given alias."""
+        self.cache = caches[alias]
+
+    def take(self, key, capacity, per_second):
+        """Take a token from a bucket and return the seconds to wait."""
+        key = f'throttle:{key}'
+        bucket, wait = refill(
+            self.cache.get(key), capacity, per_second, time.time())
+        self.cache.set(key, bucket, math.ceil(capacity / per_second))
+        return wait
+
+
+_store = None
+_store_lock = threading.Lock()
+
+
+def bucket_store():
+    """Return the process-wide bucket store chosen by the settings."""
+    global _store
+    with _store_lock:
+        if _store is None:
+            if settings.THROTTLE_CACHE_ALIAS:
+                _store = CacheBucketStore(settings.THROTTLE_CACHE_ALIAS)
+            else:
+                _store = LocalBucketStore(settings.THROTTLE_MAX_ENTRIES)
+        return _store
+
+
+@receiver(setting_changed)
+def reset_bucket_store(setting, **kwargs):
+    """Start with fresh buckets when the throttle settings change."""
+    global _store
+    if setting.startswith('THROTTLE_'):
+        with _store_lock:
+            _store = None
+
+
+def client_address(request):
+    """Return the client's IP address, as seen by the first trusted proxy.
+
+    Each of the THROTTLE_PROXY_COUNT proxies appends the address it was
+    reached from to X-Forwarded-For, so entries before those are up to the
+    client and are ignored.
+    """
+    proxies = settings.THROTTLE_PROXY_COUNT
+    forwarded = request.META.get('HTTP_X_FORWARDED_FOR')
+    if proxies and forwarded:
+        addresses = [address.strip() for address in forwarded.split(',')]
+        return addresses[-min(proxies, len(addresses))]
+    return request.META.get('REMOTE_ADDR', '')
+
+
+def client_buckets(scope, request):
+    """Return the (bucket key, rate) pairs of the client making a request."""
+    buckets = []
+    rate = settings.THROTTLE_IP_RATES.get(scope)
+    if rate:
+        buckets.append((f'ip:{client_address(request)}', rate))
+    rate = settings.THROTTLE_RATES.get(scope)
+    session = getattr(request, 'session', None)
+    if rate and session is not None and session.session_key:
+        user_id = session.get(SESSION_KEY)
+        if user_id is not None:
+            buckets.append((f'user:{user_id}', rate))
+    return buckets
+
+
+def check(scope, request):
+    """Return a 429 response if the client is over one of the scope's rates."""
+    if request.method in ('GET', 'HEAD', 'OPTIONS'):
+        return None
+    store = bucket_store()
+    wait = 0
+    for key, rate in client_buckets(scope, request):
+        capacity, per_second = parse_rate(rate)
+        wait = max(wait, store.take(f'{scope}:{key}', capacity, per_second))
+    if not wait:
+        return None
+    response = HttpResponse('Too many requests, try again later.',
+                            status=429, content_type='text/plain')
+    response['Retry-After'] = str(math.ceil(wait))
+    return response
+
+
+def throttle(scope):
+    """Decorate a sync or async view to throttle its unsafe requests."""
+    def decorator(view):
+        if asyncio.iscoroutinefunction(view):
+            @functools.wraps(view)
+            async def wrapper(request, *args, **kwargs):
+                # Reading the session may query the database.
+                rejected = await sync_to_async(check)(scope, request)
+                if rejected is not None:
+                    return rejected
+                return await view(request, *args, **kwargs)
+        else:
+            @functools.wraps(view)
+            def wrapper(request, *args, **kwargs):
+                rejected = check(scope, request)
+                if rejected is not None:
+                    return rejected
+                return view(request, *args, **kwargs)
+        return wrapper
+    return decorator
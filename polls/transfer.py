@@ -0,0 +1,43 @@
+"""This module contains the vote file formats used by import and export.
+
+Each vote is one record with the voter's username and the question and
+choice ids, written either as JSON Lines or as CSV with a header row.
+"""
+import csv
+import json
+
+FIELDS = ('user', 'question', 'choice')
+FORMATS = ('jsonl', 'csv')
+
+
+def guess_format(path, default='jsonl'):
+    """Return the format implied by a file name's extension."""
+    return 'csv' if str(path).lower().endswith('.csv') else default
+
+
+def read_votes(stream, fmt):
+    """Yield (username, question_id, choice_id) tuples from a text stream."""
+    if fmt == 'csv':
+        rows = csv.DictReader(stream)
+    else:
+        rows = (json.loads(line) for line in stream if line.strip())
+    for row in rows:
+        yield row['user'], int(row['question']), int(row['choice'])
+
+
+def write_votes(stream, fmt, votes):
+    """Write (username, question_id, choice_id) tuples and yield a count.
+
+    The running count is yielded after every vote so callers can report
+    progress without holding the rows.
+    """
+    if fmt == 'csv':
+        writer = csv.writer(stream)
+        writer.writerow(FIELDS)
+        write = writer.writerow
+    else:
+        def write(vote):
+            stream.write(json.dumps(dict(zip(FIELDS, vote))) + '\n')
+    for count, vote in enumerate(votes, 1):
+        write(vote)
+        yield count
@@ -1,14 +1,39 @@
 """This module contains urls link."""
 
+from django.conf import settings
 from django.urls import path
 
-from . import views
+from . import api, views
+from .pagecache import page_cache
 
 
+if settings.ASYNC_VIEWS:
+    detail_view = views.AsyncDetailView.as_view()
+    results_view = views.AsyncResultsView.as_view()
+    vote_view = views.async_vote
+else:
+    detail_view = views.DetailView.as_view()
+    results_view = views.ResultsView.as_view()
+    vote_view = views.vote
+
 app_name = 'polls'
 urlpatterns = [
-    path('', views.IndexView.as_view(), name='index'),
-    path('<int:pk>/', views.DetailView.as_view(), name='detail'),
-    path('<int:pk>/results/', views.ResultsView.as_view(), name='results'),
-    path('<int:question_id>/vote/', views.vote, name='vote'),
+    path('', page_cache('index')(views.IndexView.as_view()), name='index'),
+    path('<int:pk>/', detail_view, name='detail'),
+    path('<int:pk>/results/', page_cache('results')(results_view),
+         name='results'),
+    path('<int:pk>/results/stream/', views.results_stream,
+         name='results_stream'),
+    path('<int:question_id>/vote/', vote_view, name='vote'),
+    path('api/questions/', api.question_list, name='api_questions'),
+    path('api/questions/<int:pk>/', api.question_detail, name='api_question'),
+    path('api/questions/<int:pk>/results/', api.question_results,
+         name='api_results'),
+    # The async implementations, always reachable for side-by-side checks.
+    path('async/<int:pk>/', views.AsyncDetailView.as_view(),
+         name='async_detail'),
+    path('async/<int:pk>/results/', views.AsyncResultsView.as_view(),
+         name='async_results'),
+    path('async/<int:question_id>/vote/', views.async_vote,
+         name='async_vote'),
 ]
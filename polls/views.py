@@ -1,14 +1,40 @@
 """This module contains a views of the application."""
 
 
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.contrib.auth import get_user
 from django.shortcuts import get_object_or_404, render
-from django.http import HttpResponseRedirect
+from django.http import (
+    Http404, HttpResponse, HttpResponseRedirect, StreamingHttpResponse)
 from django.contrib import messages
 from django.urls import reverse
 from django.views import generic
-from django.utils import timezone
-from .models import Choice, Question, Votes
+from django.utils.dateparse import parse_datetime
+from .clock import request_now
+from .events import tally_events
+from .ingest import vote_buffer
+from .loaders import vote_loader
+from .models import Choice, Question, QuestionQuerySet, Votes
+from .results import results_for
+from .throttle import throttle
 from django.contrib.auth.mixins import LoginRequiredMixin
+from django.contrib.auth.views import redirect_to_login
+
+
+def parse_cursor(value):
+    """Return the (pub_date, id) pair encoded in a page cursor, or None."""
+    pub_date, _, pk = (value or '').rpartition('~')
+    try:
+        pub_date, pk = parse_datetime(pub_date), int(pk)
+    except ValueError:
+        return None
+    return (pub_date, pk) if pub_date else None
+
+
+def make_cursor(question):
+    """Return the page cursor that continues after a question."""
+    return f'{question.pub_date.isoformat()}~{question.pk}'
 
 
 class IndexView(generic.ListView):
@@ -16,12 +42,38 @@ class IndexView(generic.ListView):
 
     template_name = 'polls/index.html'
     context_object_name = 'latest_question_list'
+    page_size = 10
+
+    def get_status(self):
+        """Return the status filter requested in the query string."""
+        status = self.request.GET.get('status')
+        return status if status in QuestionQuerySet.STATUSES else None
 
     def get_queryset(self):
-        """Return the last five published questions."""
-        return Question.objects.filter(
-            pub_date__lte=timezone.localtime()
-        ).order_by('-pub_date')[:5]
+        """Return one page of questions, newest first, with their status."""
+        now = request_now(self.request)
+        questions = Question.objects.with_status(now)
+        status = self.get_status()
+        if status is None:
+            questions = questions.published(now)
+        else:
+            questions = getattr(questions, status)(now)
+        after = parse_cursor(self.request.GET.get('after'))
+        return questions.page(self.page_size, after=after)
+
+    def get_context_data(self, **kwargs):
+        """Trim the look-ahead row and add the cursor of the next page."""
+        questions = list(self.object_list)
+        page = questions[:self.page_size]
+        context = super().get_context_data(object_list=page, **kwargs)
+        my_votes = vote_loader(self.request).load(q.pk for q in page)
+        for question in page:
+            question.my_choice_id = my_votes.get(question.pk)
+        context['status'] = self.get_status()
+        context['statuses'] = QuestionQuerySet.STATUSES
+        if len(questions) > self.page_size:
+            context['next_cursor'] = make_cursor(page[-1])
+        return context
 
 
 class DetailView(LoginRequiredMixin, generic.DetailView):
@@ -32,12 +84,12 @@ class DetailView(LoginRequiredMixin, generic.DetailView):
 
     def get_queryset(self):
         """Excludes any questions that aren't published yet."""
-        return Question.objects.filter(pub_date__lte=timezone.now())
+        return Question.objects.published(request_now(self.request))
 
     def get(self, request, pk):
         """Show the detail if can_vote is True,if not redirect to the index."""
-        question = get_object_or_404(Question, pk=pk)
-        user = request.user
+        question = get_object_or_404(
+            Question.objects.with_status(request_now(request)), pk=pk)
         if not question.is_published():
             messages.error(request, 'This question is not available yet.')
             return HttpResponseRedirect(reverse('polls:index'))
@@ -45,15 +97,12 @@ class DetailView(LoginRequiredMixin, generic.DetailView):
             messages.error(request, 'This question is already over')
             return HttpResponseRedirect(reverse('polls:index'))
         else:
-            selected = ""
-            try:
-                q = question.choice_set.all()
-                votes = Votes.objects.get(user=user, choice__in=q)
-                selected = votes.choice.choice_text
-            except Votes.DoesNotExist:
-                selected = ""
-            return render(request, 'polls/detail.html', {'question': question,
-                                                         'selected': selected, })
+            my_votes = vote_loader(request).load([question.pk])
+            return render(request, 'polls/detail.html', {
+                'question': question,
+                'choices': question.choice_set.all(),
+                'selected_choice_id': my_votes.get(question.pk),
+            })
 
 
 class ResultsView(generic.DetailView):
@@ -64,37 +113,160 @@ class ResultsView(generic.DetailView):
 
     def get(self, request, pk):
         """Show the results if method is True, if not redirect to the index."""
-        question = get_object_or_404(Question, pk=pk)
+        question = get_object_or_404(
+            Question.objects.with_status(request_now(request)).select_related(
+                'snapshot'), pk=pk)
 
         if not question.is_published():
             messages.error(request, 'This question is not available.')
             return HttpResponseRedirect(reverse('polls:index'))
-        return render(request, 'polls/results.html', {'question': question, })
+        return render(request, 'polls/results.html', {
+            'question': question,
+            'results': results_for(question),
+            'live_results': _has_live_results(question),
+        })
+
+
+def _has_live_results(question):
+    """Return whether the results page should subscribe to the stream."""
+    return settings.RESULTS_STREAM_ENABLED and question.can_vote()
+
 
+async def results_stream(request, pk):
+    """Stream the live tally of an open question as Server-Sent Events.
 
+    Closed questions answer 204 No Content, which tells EventSource to stop
+    reconnecting.
+    """
+    if not settings.RESULTS_STREAM_ENABLED:
+        raise Http404('Live results are disabled.')
+    question = await _aget_question(request, pk)
+    if not question.is_published():
+        raise Http404('No Question matches the given query.')
+    if not question.can_vote():
+        return HttpResponse(status=204)
+    return StreamingHttpResponse(
+        tally_events(question.pk), content_type='text/event-stream',
+        headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'})
 
+
+@throttle('vote')
 def vote(request, question_id):
     """Save a Voting choice from a question objects that user voted."""
     user = request.user
-    question = get_object_or_404(Question, pk=question_id)
+    question = get_object_or_404(
+        Question.objects.with_status(request_now(request)), pk=question_id)
+    if not question.can_vote():
+        messages.error(request, 'This question is not open for voting.')
+        return HttpResponseRedirect(reverse('polls:index'))
     try:
         selected_choice = question.choice_set.get(pk=request.POST['choice'])
-    except (KeyError, Choice.DoesNotExist):
+    except (KeyError, ValueError, Choice.DoesNotExist):
         # Redisplay the question voting form.
         return render(request, 'polls/detail.html', {
             'question': question,
+            'choices': question.choice_set.all(),
             'error_message': "You didn't select a choice.",
         })
+    if not user.is_authenticated:
+        return redirect_to_login(
+            reverse('polls:detail', args=(question.id,)))
+    if settings.VOTE_BUFFER_ENABLED:
+        vote_buffer().submit(user.pk, question.pk, selected_choice.pk)
     else:
-        try:
-            q = question.choice_set.all()
-            vote = Votes.objects.get(user=user, choice__in=q)
-        # Create a new vote if it does not exists.
-        except Votes.DoesNotExist:
-            selected = Votes.objects.create(user=user, choice=selected_choice)
-            selected.save()
-        # Replace a choice with a new choice.
-        else:
-            vote.choice = selected_choice
-            vote.save()
+        Votes.objects.cast(user, selected_choice)
+    return HttpResponseRedirect(reverse('polls:results', args=(question.id,)))
+
+
+async def _aget_question(request, pk, *related):
+    """Return the question with its status at the request's time, or 404."""
+    try:
+        return await Question.objects.with_status(
+            request_now(request)).select_related(*related).aget(pk=pk)
+    except Question.DoesNotExist:
+        raise Http404('No Question matches the given query.')
+
+
+async def _aget_user(request):
+    """Load the request's user without blocking the event loop."""
+    user = await sync_to_async(get_user)(request)
+    request.user = user
+    return user
+
+
+async def _arender_detail(request, question, **context):
+    """Render the detail page, querying the choices on a fragment miss only.
+
+    The choices are passed as a lazy queryset that only the poll_choices
+    cache tag evaluates, so the page is rendered in a thread.
+    """
+    return await sync_to_async(render)(request, 'polls/detail.html', {
+        'question': question,
+        'choices': question.choice_set.all(),
+        **context,
+    })
+
+
+class AsyncDetailView(generic.View):
+    """An async display of detail views, rendering the same page."""
+
+    async def get(self, request, pk):
+        """Show the detail if can_vote is True,if not redirect to the index."""
+        user = await _aget_user(request)
+        if not user.is_authenticated:
+            return redirect_to_login(request.get_full_path())
+        question = await _aget_question(request, pk)
+        if not question.is_published():
+            messages.error(request, 'This question is not available yet.')
+            return HttpResponseRedirect(reverse('polls:index'))
+        elif not question.can_vote():
+            messages.error(request, 'This question is already over')
+            return HttpResponseRedirect(reverse('polls:index'))
+        my_votes = await vote_loader(request).aload([question.pk])
+        return await _arender_detail(
+            request, question, selected_choice_id=my_votes.get(question.pk))
+
+
+class AsyncResultsView(generic.View):
+    """An async display of the results pages."""
+
+    async def get(self, request, pk):
+        """Show the results if method is True, if not redirect to the index."""
+        question = await _aget_question(request, pk, 'snapshot')
+        if not question.is_published():
+            messages.error(request, 'This question is not available.')
+            return HttpResponseRedirect(reverse('polls:index'))
+        return render(request, 'polls/results.html', {
+            'question': question,
+            'results': await sync_to_async(results_for)(question),
+            'live_results': _has_live_results(question),
+        })
+
+
+@throttle('vote')
+async def async_vote(request, question_id):
+    """Save a Voting choice like vote(), awaiting the database calls.
+
+    The write itself runs through sync_to_async because Votes.objects.cast()
+    needs a transaction, which the async ORM does not offer yet.
+    """
+    question = await _aget_question(request, question_id)
+    if not question.can_vote():
+        messages.error(request, 'This question is not open for voting.')
+        return HttpResponseRedirect(reverse('polls:index'))
+    try:
+        selected_choice = await question.choice_set.aget(
+            pk=request.POST['choice'])
+    except (KeyError, ValueError, Choice.DoesNotExist):
+        # Redisplay the question voting form.
+        return await _arender_detail(
+            request, question, error_message="You didn't select a choice.")
+    user = await _aget_user(request)
+    if not user.is_authenticated:
+        return redirect_to_login(
+            reverse('polls:detail', args=(question.id,)))
+    if settings.VOTE_BUFFER_ENABLED:
+        vote_buffer().submit(user.pk, question.pk, selected_choice.pk)
+    else:
+        await sync_to_async(Votes.objects.cast)(user, selected_choice)
     return HttpResponseRedirect(reverse('polls:results', args=(question.id,)))